@@ -7,33 +7,28 @@ import os
 import json
 import ctypes
 from platform import system
-import pickle
 
 '''
 PyQt packages
 '''
 from PyQt5.QtWidgets import QApplication, QMainWindow, QDockWidget, QMenuBar, \
-                            QAction, QFileDialog, QScrollArea, QToolBar, \
-                            QCheckBox, QPushButton, QLabel, QMenu
-from PyQt5.QtCore import Qt, QPointF
+                            QAction, QFileDialog, QToolBar, \
+                            QCheckBox, QPushButton, QLabel, QMenu, QProgressBar
+from PyQt5.QtCore import Qt, QPointF, QThreadPool
 from PyQt5.QtGui import QIcon, QCloseEvent
 
-'''
-Data analysis packages
-'''
-import pandas as pd
-
 '''
 Custom packages
 '''
 from gui_resources.graph_widget import GraphWidget
 from gui_resources.data_selection_widget import DataSelectionWidget
 from gui_resources.settings_window import SettingsWindow
-from gui_resources.style import StyleSheet as SS
 from gui_resources.error_message import ErrorMessage
 from gui_resources.infographic_options_page import InfographicOptions
 from gui_resources.date_time_input_widget import DateTimeInput
 from gui_resources.resource_path import resource_path
+from gui_resources.data_cache import DataCache
+from gui_resources.load_worker import LoadWorker, LoadWorkerSignals
 
 
 
@@ -66,9 +61,16 @@ class CsvGui(QMainWindow):
         # Constructs tool bar
         self.constructToolBar()
 
+        # Constructs status bar widgets for loading progress
+        self.constructStatusBar()
+
         # Initialize data structures
         self.loadedData = None
 
+        # Datasets are loaded on a worker thread
+        self.ThreadPool = QThreadPool.globalInstance()
+        self.LoadWorker = None
+
         # Initialize infographic generation window 
         self.InfographicWindow = InfographicOptions(main_window=self)
     
@@ -83,6 +85,12 @@ class CsvGui(QMainWindow):
         # Construct settings window
         self.SettingsWindow = SettingsWindow(settings=self.settings)
 
+        # Cache of previously parsed csv files
+        self.DataCache = DataCache(
+            cache_dir=os.path.join(os.path.dirname(__file__), 'gui_resources\\cache'),
+            max_size_mb=self.settings.get('cache_size_mb', 2048)
+            )
+
     def constructDataSelectionDock(self) -> None:
         '''
         Initial construction for data selection dock widget
@@ -99,17 +107,9 @@ class CsvGui(QMainWindow):
             Qt.DockWidgetArea.LeftDockWidgetArea
             )
 
-        # Construct scrollable area for data sets
-        self.DockScrollArea = QScrollArea()
-        self.DockScrollArea.setStyleSheet(SS.scroll_area)
-        self.DockScrollArea.setWidgetResizable(True)
-        self.DataSelectionDock.setWidget(self.DockScrollArea)
-
-        # Construct data selection widget which holds data sets
+        # Construct data selection widget which holds data sets, the list scrolls itself
         self.DataSelectionWidget = DataSelectionWidget(graph=self.GraphWidget)
-
-        # Place the data selection widget in the scroll area 
-        self.DockScrollArea.setWidget(self.DataSelectionWidget)
+        self.DataSelectionDock.setWidget(self.DataSelectionWidget)
     
     def constructMenu(self) -> None:
         '''
@@ -143,11 +143,36 @@ class CsvGui(QMainWindow):
             )
         self.EditMenu.addAction(self.loadDataAction)
 
+        # Add action for loading a dataset that is too large to fit in memory
+        self.streamDataAction = QAction('Load Large Dataset (Streaming)')
+        self.streamDataAction.triggered.connect(
+            lambda: self.loadData(QFileDialog.getOpenFileName()[0], streaming=True)
+            )
+        self.EditMenu.addAction(self.streamDataAction)
+
+        # Add action for loading a project log saved as a folder of monthly Parquet files
+        self.loadLogAction = QAction('Load Project Log (Parquet Folder)')
+        self.loadLogAction.triggered.connect(
+            lambda: self.loadData(QFileDialog.getExistingDirectory())
+            )
+        self.EditMenu.addAction(self.loadLogAction)
+
+        # Add action for cancelling a dataset that is loading
+        self.cancelLoadAction = QAction('Cancel Loading')
+        self.cancelLoadAction.triggered.connect(self.cancelLoad)
+        self.cancelLoadAction.setEnabled(False)
+        self.EditMenu.addAction(self.cancelLoadAction)
+
         # Add action for clearing loaded dataset
         self.clearDatasetAction = QAction('Clear Dataset')
         self.clearDatasetAction.triggered.connect(self.clearLoadedDatasets)
         self.EditMenu.addAction(self.clearDatasetAction)
 
+        # Add action for clearing the parsed data cache
+        self.clearCacheAction = QAction('Clear Cache')
+        self.clearCacheAction.triggered.connect(self.DataCache.clear)
+        self.EditMenu.addAction(self.clearCacheAction)
+
         # Add action for showing data selection widget
         self.dataSelectionShow = QAction('Show Data Selection Menu')
         self.dataSelectionShow.triggered.connect(self.DataSelectionDock.show)
@@ -211,6 +236,23 @@ class CsvGui(QMainWindow):
         self.ToolBar.addWidget(self.SetXRange)
         self.ToolBar.addSeparator()
 
+    def constructStatusBar(self) -> None:
+        '''
+        Initial construction for status bar widgets
+        '''
+        # Description of the running load
+        self.LoadStatus = QLabel()
+        self.statusBar().addPermanentWidget(self.LoadStatus)
+
+        # Progress of the running load
+        self.LoadProgress = QProgressBar()
+        self.LoadProgress.setMaximumWidth(150)
+        self.LoadProgress.setRange(0, 100)
+        self.statusBar().addPermanentWidget(self.LoadProgress)
+
+        self.LoadStatus.hide()
+        self.LoadProgress.hide()
+
     def scaleXRange(self) -> None:
         '''
         Scales the x axis to a particular range using UNIX timestamps
@@ -231,10 +273,11 @@ class CsvGui(QMainWindow):
         # Scale y axis to fit data
         self.GraphWidget.enableAutoRange(axis='y')
 
-    def loadData(self, path: str) -> None:
+    def loadData(self, path: str, streaming: bool=False) -> None:
         '''
-        Loads new CSV data into the application
-        Clears the previously loaded data
+        Starts loading new CSV data into the application on a worker thread
+        The previously loaded data is cleared once the load finishes
+        streaming: bool = Stream the csv into an on-disk store with bounded memory use
         '''
         # Check if path is empty
         if path == '':
@@ -242,61 +285,74 @@ class CsvGui(QMainWindow):
 
         # Get the type of file
         filetype = path.split('/')[-1].split('.')[-1]
+        if filetype not in ('pickle', 'parquet', 'csv', 'txt'):
+            ErrorMessage(f'Invalid file type: {filetype} \nOnly accepts csv, pickle or Parquet data frames')
+            return
 
-        # Import depending on file type
-        if filetype == 'pickle':
-            df = ''
-            try:
-                with open(path, "rb") as f:
-                    df = pickle.load(f)
-            except Exception as ex:
-                print("Error during unpickling object (Possibly unsupported): ", ex)
-            #dates to UNIX
-            df[self.settings['time_header_title']] = df[self.settings['time_header_title']].map(pd.Timestamp.timestamp)
-        elif filetype == 'csv' or filetype == 'txt':
-            try:
-                # Read the CSV file at the path
-                # Also catches on_bad_lines/error_bad_lines deprecation error
-                # on_bad_lines is Pandas version 1.3.0+
-                try:
-                    df = pd.read_csv(path, 
-                        delimiter=self.settings['delimiter'],
-                        decimal=self.settings['decimal'], 
-                        low_memory=False,
-                        on_bad_lines='skip')
-                except Exception as ex:
-                    df = pd.read_csv(path, 
-                        delimiter=self.settings['delimiter'],
-                        decimal=self.settings['decimal'], 
-                        low_memory=False,
-                        error_bad_lines=False)
-
-                # Catch empty data frame
-                if df.empty:
-                    raise Exception('Loaded csv file is empty')
-
-                # Convert times to Pandas TimeStamp, removes failed conversions 
-                date_time_format = self.settings['date_time_format']
-                time_header_title = self.settings['time_header_title']
-                df[time_header_title] = pd.to_datetime(df[time_header_title], format=date_time_format, errors='coerce')
-                df = df.dropna(subset=[time_header_title])
-
-                if df.empty:
-                    raise Exception((
-                        f'Error with date/time formatting \n'
-                        f'Current format: {date_time_format}'
-                        ))
-                # Convert times to UNIX integer format 
-                df[time_header_title] = df[time_header_title].map(pd.Timestamp.timestamp)
-
-            except Exception as ex:
-                ErrorMessage(f"Failed to load csv file. \nException:  {ex} \n\nAlso check if the correct delimiter and decimal character have been selected in settings. \n \
-                            Current delimiter:   {self.settings['delimiter']} \n \
-                            Current decimal:   {self.settings['decimal']} ")
-                return
-        else:
-            ErrorMessage(f'Invalid file type: {filetype} \nOnly accepts csv or pickle data frames')
+        # Only one load runs at a time
+        self.stopLoad()
+
+        # Parse the file on the thread pool and report back through signals
+        self.LoadWorker = LoadWorker(path, self.settings, self.DataCache, streaming=streaming)
+        self.LoadWorker.signals.progress.connect(self.onLoadProgress)
+        self.LoadWorker.signals.finished.connect(self.onLoadFinished)
+        self.LoadWorker.signals.failed.connect(self.onLoadFailed)
+        self.LoadWorker.signals.cancelled.connect(self.onLoadCancelled)
+        self.ThreadPool.start(self.LoadWorker)
+
+        # Show the load in the status bar
+        self.LoadStatus.setText(f'Loading {os.path.basename(path)}')
+        self.LoadStatus.show()
+        self.LoadProgress.setValue(0)
+        self.LoadProgress.show()
+        self.cancelLoadAction.setEnabled(True)
+
+    def cancelLoad(self) -> None:
+        '''
+        Cancels the dataset load that is currently running
+        '''
+        if self.LoadWorker is not None:
+            self.statusBar().showMessage('Loading cancelled', 3000)
+        self.stopLoad()
+
+    def stopLoad(self) -> None:
+        '''
+        Stops the running load without reporting it, signals it still sends are ignored
+        '''
+        if self.LoadWorker is not None:
+            self.LoadWorker.cancel()
+            self.LoadWorker = None
+        self.hideLoadStatus()
+
+    def hideLoadStatus(self) -> None:
+        '''
+        Hides the loading progress from the status bar
+        '''
+        self.LoadStatus.hide()
+        self.LoadProgress.hide()
+        self.cancelLoadAction.setEnabled(False)
+
+    def onLoadProgress(self, bytes_read: int, total_bytes: int, rows: int) -> None:
+        '''
+        Slot for showing progress of the running load in the status bar
+        '''
+        if self.sender() is not self.activeLoadSignals():
+            return
+        self.LoadStatus.setText(
+            f'Loading: {bytes_read/1e6:.1f} / {total_bytes/1e6:.1f} MB, {rows:,} rows'
+            )
+        self.LoadProgress.setValue(int(100*bytes_read/max(total_bytes, 1)))
+
+    def onLoadFinished(self, result: tuple) -> None:
+        '''
+        Slot for receiving the parsed data from the load worker
+        '''
+        # Ignore results from loads that have since been cancelled
+        if self.sender() is not self.activeLoadSignals():
             return
+        self.LoadWorker = None
+        self.hideLoadStatus()
+        df, datasets = result
 
         # If load was succesful we can clear old data and the graph
         self.clearLoadedDatasets()
@@ -305,21 +361,39 @@ class CsvGui(QMainWindow):
         # Save new data
         self.loadedData = df
 
-        # Check if the data is from a Siemens log
-        # If it is we pivot it so it is easier to work with
-        if 'VarName' in df.columns:
-            # Pivot the dataframe so it is easier to select data by tag name
-            pivot_table = pd.pivot_table(data=df, index=['VarName', 'TimeString'])
-
-            # Find all unique device tags and store the data in a dictionary
-            # Dictionary key = tag string
-            # Dictionary value = dataframe with time and device value
-            for name in pivot_table.index.unique(level='VarName'):
-                self.DataSelectionWidget.addDataSet(name, pivot_table.loc[(name, )], self.GraphWidget)
-        else:
-            for name in df.columns:
-                self.DataSelectionWidget.addDataSet(name, df, self.GraphWidget)
+        # Create a data set for each tag/column, plot items are built when a data set is first shown
+        self.DataSelectionWidget.addDataSets(datasets)
+
+    def onLoadFailed(self, ex: str) -> None:
+        '''
+        Slot for showing errors raised by the load worker
+        '''
+        if self.sender() is not self.activeLoadSignals():
+            return
+        self.LoadWorker = None
+        self.hideLoadStatus()
+        ErrorMessage(f"Failed to load csv file. \nException:  {ex} \n\nAlso check if the correct delimiter and decimal character have been selected in settings. \n \
+                    Current delimiter:   {self.settings['delimiter']} \n \
+                    Current decimal:   {self.settings['decimal']} ")
 
+    def onLoadCancelled(self) -> None:
+        '''
+        Slot for a load worker that stopped after being cancelled
+        Loads cancelled or replaced from the GUI are no longer active and are ignored
+        '''
+        if self.sender() is not self.activeLoadSignals():
+            return
+        self.LoadWorker = None
+        self.hideLoadStatus()
+        self.statusBar().showMessage('Loading cancelled', 3000)
+
+    def activeLoadSignals(self) -> LoadWorkerSignals:
+        '''
+        Returns the signal object of the running load worker
+        '''
+        if self.LoadWorker is None:
+            return None
+        return self.LoadWorker.signals
 
     def clearLoadedDatasets(self) -> None:
         '''
@@ -361,6 +435,7 @@ class CsvGui(QMainWindow):
         '''
         Overwrite of close event to close the other windows
         '''
+        self.stopLoad()
         self.InfographicWindow.close()
         self.SettingsWindow.close()
         return super().closeEvent(a0)
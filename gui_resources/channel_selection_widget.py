@@ -1,6 +1,6 @@
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, \
-                            QGridLayout, QButtonGroup, QDockWidget
+                            QGridLayout, QButtonGroup, QDockWidget, QListWidget, QListWidgetItem
 from pandas import DataFrame
 import pyqtgraph as pg
 import sys
@@ -30,12 +30,35 @@ class ButtonGrid(QWidget):
                 btn = SelectorButton(row, col, self)
                 self.ButtonGroup.addButton(btn, row*3+col)
                 self.layout.addWidget(btn, row, col)
+
+        # Graph cell the channels are selected for
+        self.selectedButton = None
+        self.ButtonGroup.buttonClicked.connect(self.select)
     
     def buttonAt(self, row: int, col: int) -> SelectorButton:
         '''
         Returns the widget at (row, col)
         '''
         return self.layout.itemAt(row*self.layout.columnCount() + col).widget()
+
+    def select(self, btn: SelectorButton) -> None:
+        '''
+        Shows a button as the selected graph cell
+        '''
+        if self.selectedButton is not None:
+            self.selectedButton.unselected()
+        self.selectedButton = btn
+        btn.selected()
+
+    def buttonHovered(self, btn: SelectorButton) -> None:
+        '''
+        Called by a child button when it is hovered over, the selection is only changed by clicking
+        '''
+
+    def buttonUnhovered(self, btn: SelectorButton) -> None:
+        '''
+        Called by a child button when it is no longer hovered over
+        '''
     
 
 
@@ -54,4 +77,44 @@ class ChannelSelectionWidget(QDockWidget):
         self.graphSelection = ButtonGrid(*parent.GraphArraySize, parent)
         self.graphSelection.setMaximumHeight(150)
         self.graphSelection.ButtonGroup.setExclusive(True)
-        self.layout.addWidget(self.graphSelection)
\ No newline at end of file
+        self.graphSelection.ButtonGroup.buttonClicked.connect(lambda btn: self.showChannels())
+        self.layout.addWidget(self.graphSelection)
+
+        # Channels of the log, checked channels are drawn on the selected graph
+        self.channelList = QListWidget()
+        self.channelList.itemChanged.connect(self.channelToggled)
+        self.layout.addWidget(self.channelList)
+        self.graphSelection.select(self.graphSelection.buttonAt(0, 0))
+
+    def setChannels(self, names: list) -> None:
+        '''
+        Lists the channels of the log, one per buffer column
+        '''
+        self.channelList.clear()
+        for name in names:
+            item = QListWidgetItem(str(name))
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            self.channelList.addItem(item)
+        self.showChannels()
+
+    def showChannels(self) -> None:
+        '''
+        Checks the channels drawn on the selected graph
+        '''
+        btn = self.graphSelection.selectedButton
+        bound = set(self.parent.Graphs.boundChannels(btn.row, btn.col))
+        self.channelList.blockSignals(True)
+        for column in range(self.channelList.count()):
+            self.channelList.item(column).setCheckState(Qt.Checked if column in bound else Qt.Unchecked)
+        self.channelList.blockSignals(False)
+
+    def channelToggled(self, item: QListWidgetItem) -> None:
+        '''
+        Binds or unbinds a channel on the selected graph
+        '''
+        btn = self.graphSelection.selectedButton
+        column = self.channelList.row(item)
+        if item.checkState() == Qt.Checked:
+            self.parent.Graphs.bindChannel(btn.row, btn.col, column, item.text())
+        else:
+            self.parent.Graphs.unbindChannel(btn.row, btn.col, column)
\ No newline at end of file
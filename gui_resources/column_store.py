@@ -0,0 +1,200 @@
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+
+class ColumnStore:
+    '''
+    On-disk columnar store of (time, value) series
+    Each series is kept as two raw binary files, UNIX times as float64 and values as float32,
+    which are memory mapped when read so the series never have to fit in RAM at once
+    path: str = Directory the store is kept in
+    '''
+    time_dtype = np.float64
+    value_dtype = np.float32
+
+    # Rows held in memory at once when merging the sorted runs of a series
+    merge_rows = 1_000_000
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        # Series name -> {'file': file name prefix, 'rows': number of samples, 'sorted': bool,
+        #                 'last': last time, 'runs': first row of every sorted run}
+        self.index = {}
+
+        # Load the index of a previously finished store
+        if self.isComplete(path):
+            with open(os.path.join(path, 'index.json'), 'r') as json_file:
+                self.index = json.load(json_file)
+
+    @staticmethod
+    def isComplete(path: str) -> bool:
+        '''
+        Check if a finished store exists at the path
+        The index is only written once ingestion finishes
+        '''
+        return os.path.exists(os.path.join(path, 'index.json'))
+
+    @classmethod
+    def create(cls, path: str) -> 'ColumnStore':
+        '''
+        Creates a new empty store, removing anything previously at the path
+        '''
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        return cls(path)
+
+    def append(self, name: str, times: np.ndarray, values: np.ndarray) -> None:
+        '''
+        Appends samples to a series, creating the series if needed
+        '''
+        if len(times) == 0:
+            return
+        times = np.ascontiguousarray(times, dtype=self.time_dtype)
+        values = np.ascontiguousarray(values, dtype=self.value_dtype)
+
+        if name not in self.index:
+            self.index[name] = {'file': str(len(self.index)), 'rows': 0, 'sorted': True, 'last': None, 'runs': [0]}
+        entry = self.index[name]
+
+        # Chunks are written sorted, a chunk starting before the end of the last one starts a new
+        # sorted run, finish() merges the runs
+        if not np.all(times[1:] >= times[:-1]):
+            order = np.argsort(times, kind='stable')
+            times = times[order]
+            values = values[order]
+        if entry['last'] is not None and times[0] < entry['last']:
+            entry['sorted'] = False
+            entry['runs'].append(entry['rows'])
+        entry['last'] = float(times[-1])
+
+        # Files are opened per append so thousands of tags do not exhaust file handles
+        with open(self.filePath(name, 'time'), 'ab') as f:
+            f.write(times.tobytes())
+        with open(self.filePath(name, 'value'), 'ab') as f:
+            f.write(values.tobytes())
+        entry['rows'] += len(times)
+
+    def finish(self) -> None:
+        '''
+        Merges the sorted runs of series that were not written in time order and writes the index
+        '''
+        for name, entry in self.index.items():
+            if not entry['sorted']:
+                self.mergeRuns(name)
+                entry['sorted'] = True
+                entry['runs'] = [0]
+
+        with open(os.path.join(self.path, 'index.json'), 'w+') as json_file:
+            json.dump(self.index, json_file)
+
+    def mergeRuns(self, name: str) -> None:
+        '''
+        Merges the sorted runs of a series into one sorted series, equal times keep their file order
+        The runs are read in blocks so at most about merge_rows rows are in memory at once
+        '''
+        times, values = self.series(name)
+        bounds = self.index[name]['runs'] + [len(times)]
+        runs = [[start, end] for start, end in zip(bounds[:-1], bounds[1:])]
+        block = max(self.merge_rows // len(runs), 1024)
+
+        time_path = self.filePath(name, 'time') + '.merge'
+        value_path = self.filePath(name, 'value') + '.merge'
+        with open(time_path, 'wb') as time_file, open(value_path, 'wb') as value_file:
+            while runs:
+                # Rows up to the smallest last time of the blocks can not be preceded by unread rows
+                ends = [min(start + block, end) for start, end in runs]
+                threshold = min(times[end - 1] for (start, _), end in zip(runs, ends))
+
+                # An unread row equal to the threshold must come before equal rows of later runs
+                tied = [i for i, ((_, end), block_end) in enumerate(zip(runs, ends))
+                        if block_end < end and times[block_end - 1] == threshold]
+                first_tied = tied[0] if tied else len(runs)
+
+                parts = []
+                for i, ((start, _), block_end) in enumerate(zip(runs, ends)):
+                    side = 'right' if i <= first_tied else 'left'
+                    stop = start + int(np.searchsorted(times[start:block_end], threshold, side=side))
+                    parts.append((start, stop))
+                    runs[i][0] = stop
+
+                # Runs are concatenated in order, a stable sort keeps equal times in file order
+                merged_times = np.concatenate([times[start:stop] for start, stop in parts])
+                merged_values = np.concatenate([values[start:stop] for start, stop in parts])
+                order = np.argsort(merged_times, kind='stable')
+                time_file.write(merged_times[order].tobytes())
+                value_file.write(merged_values[order].tobytes())
+                runs = [run for run in runs if run[0] < run[1]]
+
+        del times, values
+        os.replace(time_path, self.filePath(name, 'time'))
+        os.replace(value_path, self.filePath(name, 'value'))
+
+    def filePath(self, name: str, column: str) -> str:
+        '''
+        Returns the location of the time or value file of a series
+        '''
+        return os.path.join(self.path, f"{self.index[name]['file']}.{column}")
+
+    def names(self) -> list:
+        '''
+        Returns the names of all series in the store
+        '''
+        return list(self.index.keys())
+
+    def series(self, name: str) -> tuple:
+        '''
+        Returns read only memory mapped (times, values) arrays for a series
+        '''
+        rows = self.index[name]['rows']
+        times = np.memmap(self.filePath(name, 'time'), dtype=self.time_dtype, mode='r', shape=(rows,))
+        values = np.memmap(self.filePath(name, 'value'), dtype=self.value_dtype, mode='r', shape=(rows,))
+        return times, values
+
+    @property
+    def empty(self) -> bool:
+        '''
+        Check if the store holds any samples, mirrors DataFrame.empty
+        '''
+        return not any(entry['rows'] for entry in self.index.values())
+
+    def timeRange(self) -> tuple:
+        '''
+        Returns the first and last UNIX time across all series
+        '''
+        starts = []
+        ends = []
+        for name in self.names():
+            times, _ = self.series(name)
+            if len(times):
+                starts.append(times[0])
+                ends.append(times[-1])
+        return min(starts), max(ends)
+
+    def toFrame(self, start: float, end: float) -> pd.DataFrame:
+        '''
+        Returns the samples between start and end (UNIX times) in the Siemens log
+        layout used by the infographic (VarName, TimeString, VarValue)
+        Only the requested window of each series is read from disk, start and end are exclusive
+        '''
+        frames = []
+        for name in self.names():
+            times, values = self.series(name)
+            lower = np.searchsorted(times, start, side='right')
+            upper = np.searchsorted(times, end, side='left')
+            if lower >= upper:
+                continue
+            frames.append(pd.DataFrame({
+                'VarName': name,
+                'TimeString': np.array(times[lower:upper]),
+                'VarValue': np.array(values[lower:upper], dtype=np.float64)
+                }))
+        if not frames:
+            return pd.DataFrame(columns=['VarName', 'TimeString', 'VarValue'])
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,165 @@
+import os
+import json
+import shutil
+import hashlib
+
+import pandas as pd
+
+# Feather files need pyarrow, caching is skipped if it is not installed
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+
+class DataCache:
+    '''
+    Columnar (Feather) cache for parsed data logs, also holds the ColumnStores of streamed logs
+    Entries are keyed on the source file path, modification time and size as well as the
+    csv import settings, so a changed file or changed settings is never served stale data
+    cache_dir: str = Directory the cache files are stored in
+    max_size_mb: float = Total size of the cache before the least recently used entries are evicted
+    '''
+    # Settings that change how a csv file is parsed
+    settings_keys = ('delimiter', 'decimal', 'date_time_format', 'time_header_title')
+
+    def __init__(self, cache_dir: str, max_size_mb: float=2048) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb*1024*1024
+
+    def enabled(self) -> bool:
+        '''
+        Check if caching is available and turned on
+        '''
+        return feather is not None and self.max_size > 0
+
+    def key(self, path: str, settings: dict) -> str:
+        '''
+        Returns the cache key for a source file and the current import settings
+        '''
+        stat = os.stat(path)
+        identity = [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+        identity += [settings.get(key) for key in self.settings_keys]
+        return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+    def entryPath(self, key: str) -> str:
+        '''
+        Returns the location of the cache file for a key
+        '''
+        return os.path.join(self.cache_dir, f'{key}.feather')
+
+    def storePath(self, path: str, settings: dict) -> str:
+        '''
+        Returns the location of the streamed ColumnStore for a source file
+        '''
+        return os.path.join(self.cache_dir, f'{self.key(path, settings)}.store')
+
+    def touch(self, entry: str) -> None:
+        '''
+        Marks an entry as recently used so it is evicted last
+        '''
+        if os.path.isdir(entry):
+            entry = os.path.join(entry, 'index.json')
+        os.utime(entry)
+
+    def load(self, path: str, settings: dict) -> pd.DataFrame:
+        '''
+        Returns the cached data frame for the source file or None if there is no valid entry
+        '''
+        if not self.enabled():
+            return None
+
+        entry = self.entryPath(self.key(path, settings))
+        if not os.path.exists(entry):
+            return None
+
+        try:
+            df = feather.read_feather(entry)
+        except Exception as ex:
+            print('Error reading cached data, removing entry: ', ex)
+            os.remove(entry)
+            return None
+
+        # Mark the entry as recently used so it is evicted last
+        self.touch(entry)
+        return df
+
+    def store(self, path: str, settings: dict, df: pd.DataFrame) -> None:
+        '''
+        Writes a parsed data frame to the cache and evicts old entries if the cache is full
+        '''
+        if not self.enabled():
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self.entryPath(self.key(path, settings))
+
+        # Write to a temporary file first so a failed write never leaves a corrupt entry
+        try:
+            feather.write_feather(df.reset_index(drop=True), entry + '.tmp')
+            os.replace(entry + '.tmp', entry)
+        except Exception as ex:
+            print('Error caching data (Possibly unsupported column types): ', ex)
+            if os.path.exists(entry + '.tmp'):
+                os.remove(entry + '.tmp')
+            return
+
+        self.evict()
+
+    def entries(self) -> list:
+        '''
+        Returns (path, size, last used) for all cache entries, least recently used first
+        Entries are Feather files and streamed ColumnStore directories
+        '''
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, file_name)
+            if file_name.endswith('.feather'):
+                stat = os.stat(path)
+                entries.append((path, stat.st_size, stat.st_mtime))
+            elif file_name.endswith('.store'):
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                # Unfinished stores have no index yet and count as least recently used
+                index = os.path.join(path, 'index.json')
+                last_used = os.stat(index).st_mtime if os.path.exists(index) else 0
+                entries.append((path, size, last_used))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, keep: str=None) -> None:
+        '''
+        Removes least recently used entries until the cache fits in the size limit
+        keep: str = Entry that must not be removed, i.e. the store that is currently open
+        '''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            self.remove(path)
+            total -= size
+
+    def remove(self, entry: str) -> None:
+        '''
+        Removes a single cache entry
+        '''
+        try:
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            else:
+                os.remove(entry)
+        except OSError as ex:
+            # Stores that are memory mapped by the open dataset can not be removed on Windows
+            print('Error removing cache entry: ', ex)
+
+    def clear(self) -> None:
+        '''
+        Removes all cache entries
+        '''
+        for path, _, _ in self.entries():
+            self.remove(path)
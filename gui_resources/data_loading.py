@@ -0,0 +1,339 @@
+import os
+import time
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from gui_resources.column_store import ColumnStore
+from gui_resources.infographic_logging.data_object import read_log
+
+
+
+def datetime_to_unix(times: pd.Series) -> pd.Series:
+    '''
+    Converts a datetime series to UNIX timestamps (float seconds) in one vectorized pass
+    Time zone aware series are converted to UTC first, naive series are treated as UTC
+    which matches the behaviour of pd.Timestamp.timestamp
+    '''
+    # Series that are already numeric are assumed to be UNIX timestamps
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        return times.astype(np.float64)
+
+    # Drop the time zone so the underlying int64 values are UTC nanoseconds
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert('UTC').dt.tz_localize(None)
+
+    # View the datetimes as int64 nanoseconds and scale to seconds
+    values = times.to_numpy(dtype='datetime64[ns]')
+    seconds = values.view(np.int64) / 1e9
+
+    # Keep missing values as NaN instead of the NaT sentinel integer
+    seconds[np.isnat(values)] = np.nan
+
+    return pd.Series(seconds, index=times.index, name=times.name)
+
+
+class LoadCancelled(Exception):
+    '''
+    Raised when a data load is cancelled part way through
+    '''
+
+
+
+def csv_chunk_reader(f, settings: dict, chunk_size: int):
+    '''
+    Returns a pandas chunk reader for a csv file using the csv import settings
+    '''
+    # Also catches on_bad_lines/error_bad_lines deprecation error
+    # on_bad_lines is Pandas version 1.3.0+
+    try:
+        return pd.read_csv(f, 
+            delimiter=settings['delimiter'],
+            decimal=settings['decimal'], 
+            low_memory=False,
+            on_bad_lines='skip',
+            chunksize=chunk_size)
+    except Exception as ex:
+        return pd.read_csv(f, 
+            delimiter=settings['delimiter'],
+            decimal=settings['decimal'], 
+            low_memory=False,
+            error_bad_lines=False,
+            chunksize=chunk_size)
+
+
+def read_csv_log(path: str, settings: dict, progress=None, cancelled=None,
+                 chunk_size: int=200_000) -> pd.DataFrame:
+    '''
+    Reads a csv data log using the csv import settings
+    Rows with times that do not match the date/time format are removed
+    and the time column is converted to UNIX timestamps
+    progress: callable = Called after every chunk with (bytes read, total bytes, rows parsed)
+    cancelled: callable = Polled after every chunk, the load stops with LoadCancelled if it returns True
+    '''
+    total_bytes = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        # Read the CSV file at the path in chunks so progress can be reported
+        reader = csv_chunk_reader(f, settings, chunk_size)
+
+        chunks = []
+        rows = 0
+        with reader:
+            for chunk in reader:
+                chunks.append(chunk)
+                rows += len(chunk)
+                if progress is not None:
+                    progress(min(f.tell(), total_bytes), total_bytes, rows)
+                if cancelled is not None and cancelled():
+                    raise LoadCancelled()
+
+    # Catch empty data frame
+    if rows == 0:
+        raise Exception('Loaded csv file is empty')
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+    # Convert times to Pandas TimeStamp, removes failed conversions 
+    date_time_format = settings['date_time_format']
+    time_header_title = settings['time_header_title']
+    df[time_header_title] = pd.to_datetime(df[time_header_title], format=date_time_format, errors='coerce')
+    df = df.dropna(subset=[time_header_title])
+
+    if df.empty:
+        raise Exception((
+            f'Error with date/time formatting \n'
+            f'Current format: {date_time_format}'
+            ))
+
+    # Convert times to UNIX integer format 
+    df[time_header_title] = datetime_to_unix(df[time_header_title])
+
+    return df
+
+
+def chunk_rows_for_memory(path: str, memory_limit_mb: float) -> int:
+    '''
+    Estimates how many csv rows can be parsed at once while staying under the memory limit
+    Uses the average line length at the start of the file
+    '''
+    with open(path, 'rb') as f:
+        sample = f.read(1 << 16)
+    bytes_per_line = len(sample) / max(sample.count(b'\n'), 1)
+
+    # A parsed chunk (object columns, temporary copies during conversion) takes
+    # roughly this many times the size of its text
+    parse_overhead = 10
+    return max(1000, int(memory_limit_mb*1024*1024 / (bytes_per_line*parse_overhead)))
+
+
+def stream_csv_to_store(path: str, settings: dict, store_path: str, memory_limit_mb: float=512,
+                        progress=None, cancelled=None) -> ColumnStore:
+    '''
+    Reads a csv data log chunk by chunk into an on-disk ColumnStore so logs larger than RAM can be opened
+    Each chunk has its times converted to UNIX float64 and its values to float32 before it is written,
+    so peak memory is bounded by memory_limit_mb rather than by the size of the file
+    progress: callable = Called after every chunk with (bytes read, total bytes, rows parsed)
+    cancelled: callable = Polled after every chunk, the load stops with LoadCancelled if it returns True
+    '''
+    total_bytes = os.path.getsize(path)
+    chunk_size = chunk_rows_for_memory(path, memory_limit_mb)
+    date_time_format = settings['date_time_format']
+    time_header_title = settings['time_header_title']
+
+    store = ColumnStore.create(store_path)
+    rows = 0
+    with open(path, 'rb') as f, csv_chunk_reader(f, settings, chunk_size) as reader:
+        for chunk in reader:
+            rows += len(chunk)
+
+            # Convert times to UNIX, removes failed conversions
+            times = pd.to_datetime(chunk[time_header_title], format=date_time_format, errors='coerce')
+            chunk = chunk.loc[times.notna()]
+            times = datetime_to_unix(times.loc[times.notna()]).to_numpy()
+
+            # Siemens logs have one row per tag sample, other logs have one column per tag
+            if 'VarName' in chunk.columns:
+                values = pd.to_numeric(chunk['VarValue'], errors='coerce').to_numpy(dtype=np.float32)
+                for name, indices in chunk.groupby('VarName').indices.items():
+                    store.append(name, times[indices], values[indices])
+            else:
+                for name in chunk.columns:
+                    if name == time_header_title:
+                        continue
+                    values = pd.to_numeric(chunk[name], errors='coerce').to_numpy(dtype=np.float32)
+                    store.append(name, times, values)
+
+            if progress is not None:
+                progress(min(f.tell(), total_bytes), total_bytes, rows)
+            if cancelled is not None and cancelled():
+                raise LoadCancelled()
+
+    if rows == 0:
+        raise Exception('Loaded csv file is empty')
+    if store.empty:
+        raise Exception((
+            f'Error with date/time formatting \n'
+            f'Current format: {date_time_format}'
+            ))
+
+    store.finish()
+    return store
+
+
+def read_pickle_log(path: str, settings: dict) -> pd.DataFrame:
+    '''
+    Reads a pickled data frame and converts the time column to UNIX timestamps
+    '''
+    with open(path, "rb") as f:
+        df = pickle.load(f)
+
+    #dates to UNIX
+    df[settings['time_header_title']] = datetime_to_unix(df[settings['time_header_title']])
+    return df
+
+
+def read_parquet_log(path: str, settings: dict) -> pd.DataFrame:
+    '''
+    Reads a project log saved as monthly Parquet files and converts the time column to UNIX timestamps
+    path: str = The "<project name>.parquet" folder or one of its monthly files, the whole log is read
+                either way. Other Parquet files are read as a data frame like a pickle
+    '''
+    folder = path if os.path.isdir(path) else os.path.dirname(path)
+    if folder.endswith('.parquet'):
+        df = read_log(folder[:-len('.parquet')])
+        if df is None:
+            raise FileNotFoundError(f'No monthly log files in {folder}')
+        time_header = 'TimeString'
+    else:
+        df = pd.read_parquet(path)
+        time_header = settings['time_header_title']
+
+    #dates to UNIX
+    df[time_header] = datetime_to_unix(df[time_header])
+    return df
+
+
+def split_by_tag(names: pd.Series, times: pd.Series, values: pd.Series) -> list:
+    '''
+    Splits long format (tag, time, value) samples into one (times, values) pair per tag in a single pass
+    The samples are sorted once by tag then time, so every tag is a contiguous slice and the
+    returned arrays are views into the sorted arrays rather than copies
+    Matches pd.pivot_table: tags are in sorted order, samples with the same tag and time
+    are averaged (ignoring NaN), samples without a tag or a value are dropped and so are
+    tags left without samples
+    '''
+    codes, tags = pd.factorize(names, sort=True)
+    times = times.to_numpy(dtype=np.float64)
+    values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+
+    # Sort once by tag then time, samples without a tag have code -1 and sort to the front
+    # A stable sort by time followed by a stable sort by tag code equals a lexsort, but is much faster:
+    # logs are usually already in time order and 16 bit tag codes are radix sorted
+    if len(tags) < np.iinfo(np.int16).max:
+        codes = codes.astype(np.int16)
+    order = np.argsort(times, kind='stable')
+    order = order[np.argsort(codes[order], kind='stable')]
+    codes = codes[order]
+    times = times[order]
+    values = values[order]
+    first = np.searchsorted(codes, 0)
+    codes, times, values = codes[first:], times[first:], values[first:]
+
+    # Average samples that share a tag and time like the pivot table mean does
+    duplicate = (codes[1:] == codes[:-1]) & (times[1:] == times[:-1])
+    if duplicate.any():
+        starts = np.flatnonzero(np.concatenate(([True], ~duplicate)))
+        valid = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(valid, values, 0), starts)
+        counts = np.add.reduceat(valid.astype(np.int64), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = sums / counts
+        codes = codes[starts]
+        times = times[starts]
+
+    # Samples without a value, including groups of only NaN samples, are not in the pivot table
+    valid = ~np.isnan(values)
+    if not valid.all():
+        codes, times, values = codes[valid], times[valid], values[valid]
+
+    # Each tag is the contiguous slice between its boundaries
+    bounds = np.searchsorted(codes, np.arange(len(tags) + 1))
+    return [
+        (tag, (times[bounds[i]:bounds[i+1]], values[bounds[i]:bounds[i+1]]))
+        for i, tag in enumerate(tags)
+        if bounds[i+1] > bounds[i]
+        ]
+
+
+def split_data_sets(df: pd.DataFrame) -> list:
+    '''
+    Splits a loaded data frame into (name, data) pairs, one for each data set
+    '''
+    # Siemens logs have one row per tag sample, split them into a (times, values) pair per tag
+    if 'VarName' in df.columns:
+        return split_by_tag(df['VarName'], df['TimeString'], df['VarValue'])
+    else:
+        return [(name, df) for name in df.columns]
+
+
+if __name__ == '__main__':
+    # Benchmark the vectorized conversion against the per-row Timestamp.timestamp map
+    rows = 5_000_000
+    times = pd.Series(pd.date_range('2023-01-01', periods=rows, freq='s'))
+
+    start = time.perf_counter()
+    expected = times.map(pd.Timestamp.timestamp)
+    mapped = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = datetime_to_unix(times)
+    vectorized = time.perf_counter() - start
+
+    assert np.array_equal(expected.to_numpy(), result.to_numpy())
+    print(f'{rows} rows')
+    print(f'Timestamp.timestamp map: {mapped:.3f} s')
+    print(f'Vectorized conversion:   {vectorized:.3f} s ({mapped/vectorized:.0f}x faster)')
+
+    # Benchmark splitting a Siemens log by tag against the pivot table
+    tags = 200
+    samples = 100_000
+    df = pd.DataFrame({
+        'VarName': np.tile([f'Tag_{i}' for i in range(tags)], samples),
+        'TimeString': np.repeat(1.67e9 + np.arange(samples, dtype=np.float64), tags),
+        'VarValue': np.random.rand(tags*samples)
+        })
+
+    start = time.perf_counter()
+    pivot_table = pd.pivot_table(data=df, index=['VarName', 'TimeString'])
+    expected = [(name, pivot_table.loc[(name, )]) for name in pivot_table.index.unique(level='VarName')]
+    pivoted = time.perf_counter() - start
+    del pivot_table
+
+    start = time.perf_counter()
+    result = split_data_sets(df)
+    split = time.perf_counter() - start
+
+    for (name, data), (tag, (times, values)) in zip(expected, result):
+        assert name == tag
+        assert np.array_equal(data.index.to_numpy(), times)
+        assert np.array_equal(data['VarValue'].to_numpy(), values)
+    print(f'{tags} tags x {samples} samples')
+    print(f'Pivot table:  {pivoted:.3f} s')
+    print(f'Split by tag: {split:.3f} s ({pivoted/split:.0f}x faster)')
+
+    # Check samples without values, repeated samples and a tag without any values against the pivot table
+    df = pd.DataFrame({
+        'VarName': np.random.choice(['PT305', 'FT501', 'TT101', None], 10_000),
+        'TimeString': np.random.randint(0, 500, 10_000).astype(np.float64),
+        'VarValue': np.where(np.random.rand(10_000) < 0.3, np.nan, np.random.rand(10_000))
+        })
+    df.loc[df['VarName'] == 'TT101', 'VarValue'] = np.nan
+    pivot_table = pd.pivot_table(data=df, index=['VarName', 'TimeString'])
+    expected = [(name, pivot_table.loc[(name, )]) for name in pivot_table.index.unique(level='VarName')]
+    result = split_data_sets(df)
+    assert [name for name, _ in expected] == [tag for tag, _ in result]
+    for (name, data), (tag, (times, values)) in zip(expected, result):
+        assert np.array_equal(data.index.to_numpy(), times)
+        assert np.allclose(data['VarValue'].to_numpy(), values)
+    print('Split by tag matches the pivot table with missing and repeated samples')
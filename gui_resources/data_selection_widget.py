@@ -1,7 +1,9 @@
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, \
-                            QPushButton, QColorDialog, QCheckBox, QLabel
-from pandas import DataFrame
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QSortFilterProxyModel, QPoint
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLineEdit, QListView, \
+                            QColorDialog, QMenu
+from pandas import DataFrame, Series, to_numeric
+from typing import Any
 import pyqtgraph as pg
 import sys
 import random
@@ -9,12 +11,16 @@ import numpy as np
 
 from gui_resources.style import StyleSheet as SS
 from gui_resources.style import Font
+from gui_resources.graph_widget import GraphWidget, DecimatedPlotDataItem
+from gui_resources.regression_index import RegressionIndex
 
 
 
 class DataSelectionWidget(QWidget):
     '''
     Widget subclass for containing the list of loaded data sets
+    Data sets are shown in a filterable list view so only the visible rows are drawn,
+    check a data set to show it on the graph, right click for trendline and color options
     '''
     def __init__(self, graph: pg.PlotWidget) -> None:
         super().__init__()
@@ -24,9 +30,34 @@ class DataSelectionWidget(QWidget):
 
         # Set layout
         self.layout = QVBoxLayout()
-        self.layout.setAlignment(Qt.AlignTop)
+        self.layout.setContentsMargins(0, 0, 0, 0)
         self.setLayout(self.layout)
 
+        # Search box for filtering data sets by name
+        self.SearchFilter = QLineEdit()
+        self.SearchFilter.setPlaceholderText('Search')
+        self.SearchFilter.setClearButtonEnabled(True)
+        self.layout.addWidget(self.SearchFilter)
+
+        # Model holding the data sets and a proxy that applies the search filter
+        self.Model = DataSetModel()
+        self.ProxyModel = QSortFilterProxyModel()
+        self.ProxyModel.setSourceModel(self.Model)
+        self.ProxyModel.setFilterRole(DataSetModel.NameRole)
+        self.ProxyModel.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.SearchFilter.textChanged.connect(self.ProxyModel.setFilterFixedString)
+
+        # List view of the data sets
+        self.ListView = QListView()
+        self.ListView.setModel(self.ProxyModel)
+        self.ListView.setUniformItemSizes(True)
+        self.ListView.setFont(Font.name_button)
+        self.ListView.setStyleSheet(SS.scroll_area)
+        self.ListView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.ListView.customContextMenuRequested.connect(self.openContextMenu)
+        self.ListView.doubleClicked.connect(self.colorSelectionMenu)
+        self.layout.addWidget(self.ListView)
+
         # Settings
         self.setMinimumWidth(200)
     
@@ -35,191 +66,361 @@ class DataSelectionWidget(QWidget):
         '''
         Add new data set object to the widget display using provided parameters
         '''
-        self.layout.addLayout(
-            DataSet(
-                name, data, graph, color=color, trendline=trendline
-            )
-        )
+        self.Model.addDataSets([DataSet(name, data, graph, color=color, trendline=trendline)])
+
+    def addDataSets(self, datasets: list) -> None:
+        '''
+        Add a data set for each (name, data) pair in one batch
+        '''
+        self.Model.addDataSets([DataSet(name, data, self.GraphWidget) for name, data in datasets])
+
+    def dataSet(self, index: QModelIndex) -> 'DataSet':
+        '''
+        Returns the data set for an index of the list view
+        '''
+        return self.Model.dataSet(self.ProxyModel.mapToSource(index))
     
     def clearDatasets(self) -> None:
         '''
-        Iterates through the data set objects in the widget and deletes them
+        Deletes all data set objects in the widget
         '''
-        for i in reversed(range(self.layout.count())):
-            self.layout.itemAt(i).delete()
+        self.Model.clear()
     
     def clearGraph(self) -> None:
         '''
         Clears all lines on graph and deselects all data sets
         '''
         # Iterate through data sets and uncheck them 
-        for i in range(self.layout.count()):
-            dataset = self.layout.itemAt(i).layout()
-            dataset.name.setChecked(False)
+        for dataset in self.Model.datasets:
+            dataset.checked = False
             dataset.removeTrendline()
+        self.Model.refresh()
 
         # Clear the graph widget
         self.GraphWidget.clear()
 
+    def openContextMenu(self, point: QPoint) -> None:
+        '''
+        Opens the trendline and color options for the data set under the cursor
+        '''
+        index = self.ListView.indexAt(point)
+        if not index.isValid():
+            return
+        dataset = self.dataSet(index)
+
+        menu = QMenu(self)
+        trendline = menu.addAction('Trendline')
+        trendline.setCheckable(True)
+        trendline.setChecked(dataset.trendline is not None)
+        trendline.setEnabled(dataset.checked)
+        color = menu.addAction('Change Color')
+
+        action = menu.exec(self.ListView.viewport().mapToGlobal(point))
+        if action is trendline:
+            dataset.toggleTrendline()
+        elif action is color:
+            self.colorSelectionMenu(index)
+
+    def colorSelectionMenu(self, index: QModelIndex) -> None:
+        '''
+        Opens a QColorDialog color picker for selecting the display color of a data set
+        '''
+        color = QColorDialog.getColor()
+        if color.isValid():
+            self.dataSet(index).setColor((color.red(), color.green(), color.blue()))
+
+
 
-class DataSet(QHBoxLayout):
+class DataSetModel(QAbstractListModel):
     '''
-    Horizontal layout subclass for containing data set information
+    List model of the loaded data sets used by the data selection list view
+    '''
+    # Role used by the search filter, the display text also holds the trendline label
+    NameRole = Qt.UserRole
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.datasets = []
+        self.rows = {}
+
+    def rowCount(self, parent: QModelIndex=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.datasets)
+
+    def data(self, index: QModelIndex, role: int=Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        dataset = self.datasets[index.row()]
+        if role == Qt.DisplayRole:
+            return dataset.label()
+        if role == Qt.DecorationRole:
+            return QColor(*dataset.color)
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if dataset.checked else Qt.Unchecked
+        if role in (Qt.ToolTipRole, self.NameRole):
+            return dataset.name
+        return None
+
+    def setData(self, index: QModelIndex, value: Any, role: int=Qt.EditRole) -> bool:
+        '''
+        Checking a data set shows it on the graph
+        '''
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        self.datasets[index.row()].showData(value == Qt.Checked)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def dataSet(self, index: QModelIndex) -> 'DataSet':
+        '''
+        Returns the data set for a model index
+        '''
+        return self.datasets[index.row()]
+
+    def addDataSets(self, datasets: list) -> None:
+        '''
+        Appends data sets to the end of the list
+        '''
+        if not datasets:
+            return
+        first = len(self.datasets)
+        self.beginInsertRows(QModelIndex(), first, first + len(datasets) - 1)
+        for row, dataset in enumerate(datasets, first):
+            dataset.onChanged = self.dataSetChanged
+            self.rows[dataset] = row
+            self.datasets.append(dataset)
+        self.endInsertRows()
+
+    def dataSetChanged(self, dataset: 'DataSet') -> None:
+        '''
+        Updates the row of a data set after its color or trendline changes
+        '''
+        index = self.index(self.rows[dataset])
+        self.dataChanged.emit(index, index)
+
+    def refresh(self) -> None:
+        '''
+        Updates all rows
+        '''
+        if self.datasets:
+            self.dataChanged.emit(self.index(0), self.index(len(self.datasets) - 1))
+
+    def clear(self) -> None:
+        '''
+        Deletes all data sets
+        '''
+        self.beginResetModel()
+        for dataset in self.datasets:
+            dataset.delete()
+        self.datasets = []
+        self.rows = {}
+        self.endResetModel()
+
+
+
+class DataSet:
+    '''
+    Data set shown in the data selection list
     i.e. plotting color, data set name, plot item used for graphing
+    The plot arrays and plot item are only created when the data set is first shown
     '''
     def __init__(self, name: str, data: DataFrame, graph: pg.PlotWidget,
                  color: tuple=None, trendline: bool=False) -> None:        
-        super().__init__()
-
         # Pointer to parent graph
         self.GraphWidget = graph
 
-        # Construct a plot item that can be shown/hidden on the parent graph
-        # Try Siemens pivot table format first
-        try:
-            self.PlotDataItem = pg.PlotDataItem(
-                data.index,
-                data['VarValue'].to_list(),
-                name=name
-                )
-        except:
-            self.PlotDataItem = pg.PlotDataItem(
-                data.iloc[:,0],
-                data[name].to_list(),
-                name=name
-                )
-
-        # Construct display color widget
-        self.color = QPushButton()
-        self.color.setStyleSheet("QPushButton:hover{border: 1px solid rgb(0, 0, 0);}")
-        self.color.setFixedSize(20, 20)
+        self.name = name
+        self.data = data
+        self.checked = False
         if isinstance(color, tuple):
-            self.setColor(color)
+            self.color = color
         else:
-            self.setColor((random.randint(0, 255), 
-                            random.randint(0, 255), 
-                            random.randint(0, 255)))
-        self.color.clicked.connect(self.colorSelectionMenu)
-        self.addWidget(self.color)
-
-        # Construct name widget
-        self.name = QPushButton()
-        self.name.setFixedHeight(20)
-        self.name.setCheckable(True)
-        self.name.setText(name)
-        self.name.setStyleSheet(SS.name_button)
-        self.name.setFont(Font.name_button)
-        # Connect click to hide/show the data set on the parent graph
-        self.name.clicked.connect(lambda: self.showData(self.name.isChecked()))
-        self.addWidget(self.name)
-
-        # Check box for displaying a trendline
-        self.TrendlineActive = QCheckBox('TL')
-        self.TrendlineActive.clicked.connect(self.trendlineButtonClicked)
-        self.addWidget(self.TrendlineActive)
-
-        # Trendline slope and intercept if loaded
-        self.TrendlineSlopeIntercerpt = QLabel()
-        self.addWidget(self.TrendlineSlopeIntercerpt)
-
-        # Trendline data structure
+            self.color = (random.randint(0, 255), 
+                          random.randint(0, 255), 
+                          random.randint(0, 255))
+
+        # Sorted x and y arrays of the full data set and the plot item, created by plotItem()
+        self.x = self.y = None
+        self.PlotDataItem = None
+
+        # Called with the data set when its display in the list needs updating
+        self.onChanged = None
+
+        # Trendline data structure, the regression index is built when a trendline is first shown
+        self.trendline = None
+        self.trendline_label = ''
+        self.RegressionIndex = None
         if trendline:
-            self.setTrendline()
+            self.setTrendline(*self.GraphWidget.xaxis.range)
+
+    def label(self) -> str:
+        '''
+        Returns the text shown in the data selection list
+        '''
+        if self.trendline_label:
+            return f'{self.name}    {self.trendline_label}'
+        return self.name
+
+    def notifyChanged(self) -> None:
+        '''
+        Updates the display of the data set in the list
+        '''
+        if self.onChanged is not None:
+            self.onChanged(self)
+
+    def loadArrays(self) -> None:
+        '''
+        Converts the data to sorted plot arrays the first time they are needed
+        '''
+        if self.x is None:
+            self.x, self.y = self.plotArrays(self.name, self.data)
+
+    def plotItem(self) -> DecimatedPlotDataItem:
+        '''
+        Returns the plot item of the data set, constructing it the first time it is shown
+        '''
+        if self.PlotDataItem is None:
+            self.loadArrays()
+
+            # Only the points needed for the current view are drawn
+            self.PlotDataItem = DecimatedPlotDataItem(self.x, self.y, name=self.name)
+            self.PlotDataItem.setPen(pg.mkPen(self.color, width=2))
+
+            # Register with the graph for updating the drawn points and trendline when x axis is rescaled
+            self.GraphWidget.addRangeListener(self)
+        return self.PlotDataItem
+
+    @staticmethod
+    def plotArrays(name: str, data) -> tuple:
+        '''
+        Returns numeric (x, y) arrays sorted by x for a data set
+        data can be a (times, values) pair, a Siemens pivot table or a data frame with x in the first column
+        '''
+        if isinstance(data, tuple):
+            x, y = data
         else:
-            self.trendline = None
+            # Try Siemens pivot table format first
+            try:
+                x, y = data.index, data['VarValue']
+            except:
+                x, y = data.iloc[:,0], data[name]
+
+        # Arrays from the loaders are used as is, other data is converted to floats
+        x = np.asarray(x, dtype=np.float64)
+        if not isinstance(y, np.ndarray):
+            y = to_numeric(Series(y), errors='coerce').to_numpy(dtype=np.float64)
+        elif y.dtype.kind != 'f':
+            y = y.astype(np.float64)
+
+        # The visible range is found with a binary search so x must be in order
+        if len(x) > 1 and not np.all(x[1:] >= x[:-1]):
+            order = np.argsort(x, kind='stable')
+            x, y = x[order], y[order]
+        return x, y
+
+    def isShown(self) -> bool:
+        '''
+        Check if the data set is currently shown on the graph
+        '''
+        return self.checked
+
+    def rangeChanged(self, x0: float, x1: float, pixels: int) -> None:
+        '''
+        Called by the graph once per frame after the x range changes
+        Redraws the points needed for the new view and refits the trendline
+        '''
+        self.PlotDataItem.setViewRange(x0, x1, pixels)
+        if self.trendline is not None:
+            self.setTrendline(x0, x1)
+
+    def updatePlotData(self) -> None:
+        '''
+        Redraws the points needed for the current view
+        '''
+        if self.isShown():
+            x0, x1 = self.GraphWidget.getViewBox().viewRange()[0]
+            self.PlotDataItem.setViewRange(x0, x1, self.GraphWidget.viewPixelWidth())
 
-        # Signal/slot for updating trendline when x axis is rescaled
-        self.GraphWidget.sigRangeChanged.connect(self.updateTrendline)
-    
     def setColor(self, color: tuple) -> None:
         '''
         Set the display color for the data set
         '''
-        r, g, b = color
-        self.PlotDataItem.setPen(pg.mkPen(color, width=2))
-        self.color.setStyleSheet(f"QPushButton {{ \
-            background-color: rgb({r}, {g}, {b}); \
-            border-radius: 5px; \
-            }} \
-            QPushButton:hover{{ \
-            border: 1px solid rgb(0, 0, 0); \
-            }};") 
+        self.color = color
+        if self.PlotDataItem is not None:
+            self.PlotDataItem.setPen(pg.mkPen(color, width=2))
+        if self.trendline is not None:
+            self.trendline.setPen(pg.mkPen(color, width=2, style=Qt.DashLine))
+        self.notifyChanged()
 
-    def updateTrendline(self) -> None:
+    @staticmethod
+    def trendlineWindow(x: np.ndarray, y: np.ndarray, start: float, end: float,
+                        ymin: float, ymax: float) -> tuple:
         '''
-        Called when x range is changed. Updates the trendline to match currently shown data
+        Returns the [lower, upper) index range of the data used for a trendline
+        The data is trimmed to the x range, then grown outward from its midpoint
+        for as long as the values stay within the shown y range
         '''
-        if self.trendline is None:
-            return
-        else:
-            self.removeTrendline()
-            self.setTrendline(*self.GraphWidget.xaxis.range)
+        # Trim data to x axis range
+        lower = int(np.searchsorted(x, start, side='left'))
+        upper = int(np.searchsorted(x, end, side='right'))
+        if upper <= lower:
+            return lower, lower
+        xmid = lower + (upper - lower)//2
+
+        # Trim data to y axis range, stopping at the first value outside it on each side
+        yrange = ymax-ymin
+        ypad = yrange*.1
+        above = y[xmid:upper]
+        inside = (ymin-ypad <= above) & (above <= ymax+ypad)
+        n_above = int(np.argmin(inside)) if not inside.all() else len(inside)
+        below = y[lower:xmid+1][::-1]
+        inside = (ymin*0.95 <= below) & (below <= ymax*1.05)
+        n_below = int(np.argmin(inside)) if not inside.all() else len(inside)
+
+        # Both walks include the midpoint
+        begin = xmid + 1 - n_below if n_below else xmid
+        stop = xmid + n_above if n_above else xmid + min(n_below, 1)
+        return begin, stop
 
     def setTrendline(self, start: float, end: float, ) -> None:
         '''
-        Creates a trendline for a subset of the data
+        Creates or updates a trendline for a subset of the data
         '''
-        # Show trendline is active
-        self.TrendlineActive.setChecked(True)
-        
-        # x and y data currently plotted
-        x_data = self.PlotDataItem.xData
-        y_data = self.PlotDataItem.yData
-
         # Currently shown y range
         ymin, ymax = self.GraphWidget.getAxis('left').range
 
-        # Trim data to x axis range
-        y1 = []
-        x1 = []
-        xrange = end-start
-        xpad = xrange*0
-        for i in range(0, len(x_data)):
-            if start-xpad <= x_data[i] <= end+xpad:
-                x1.append(x_data[i])
-                y1.append(y_data[i])
-        xmid = int((len(x1))/2)
-
-        # Trim data to y axis range
-        yupper = []
-        xupper = []
-        yrange = ymax-ymin
-        ypad = yrange*.1
-        for i in range(xmid, len(x1)):
-            if ymin-ypad <= y1[i] <= ymax+ypad:
-                xupper.append(x1[i])
-                yupper.append(y1[i])
-            else:
-                break
-        xtemp = []
-        ytemp = []
-        for i in range(xmid,-1,-1):
-            if ymin*0.95 <= y1[i] <= ymax*1.05:
-                xtemp.append(x1[i])
-                ytemp.append(y1[i])
-            else:
-                break
-        xlower = []
-        ylower = []
-        for i in range(len(xtemp)-1, -1,-1):
-            xlower.append(xtemp[i])
-            ylower.append(ytemp[i])
-        x = xlower+xupper
-        y = ylower+yupper
-
-        # Generate trendline
-        x2 = np.arange(0, len(x))
-        A = np.vstack([x2, np.ones(len(x))])
-        m, b = np.linalg.lstsq(A.T, y, rcond=None)[0]
-        trend = m*x2+b
-
-        # Update the slope and intercept values displayed
-        self.TrendlineSlopeIntercerpt.setText('m = {:.3f} : b = {:.3f}'.format(m*6, b))
+        # Data within the shown range, the plotted points are decimated so the full data is used
+        self.loadArrays()
+        lower, upper = self.trendlineWindow(self.x, self.y, start, end, ymin, ymax)
+
+        # Fit against time using the prefix sum index so every refit takes constant time
+        if self.RegressionIndex is None:
+            self.RegressionIndex = RegressionIndex(self.x, self.y)
+        fit = self.RegressionIndex.fit(lower, upper)
+
+        if fit is not None:
+            # The trendline is straight in time so only its end points are drawn
+            m, _ = fit
+            trend_x = self.x[[lower, upper-1]]
+            trend = self.RegressionIndex.predict(trend_x, fit)
+
+            # Update the slope (per minute) and intercept (value at the start of the trendline) displayed
+            label = 'm = {:.3f}/min : b = {:.3f}'.format(m*60, trend[0])
+        else:
+            trend_x = trend = []
+            label = ''
+        if label != self.trendline_label:
+            self.trendline_label = label
+            self.notifyChanged()
 
         # Save the trendline to the object and plot on graph
-        self.trendline = pg.PlotDataItem(x, trend)
-        self.trendline.setPen(pg.mkPen(self.getColor(), width=2, style=Qt.DashLine))
-        self.GraphWidget.addItem(self.trendline)
+        if self.trendline is None:
+            self.trendline = pg.PlotDataItem()
+            self.trendline.setPen(pg.mkPen(self.color, width=2, style=Qt.DashLine))
+            self.GraphWidget.addItem(self.trendline)
+        self.trendline.setData(trend_x, trend)
     
     def removeTrendline(self) -> None:
         '''
@@ -227,61 +428,44 @@ class DataSet(QHBoxLayout):
         '''
         if self.trendline is not None:
             self.GraphWidget.removeItem(self.trendline)
-            self.TrendlineActive.setChecked(False)
             self.trendline = None
-            self.TrendlineSlopeIntercerpt.setText('')
+            self.trendline_label = ''
+            self.notifyChanged()
     
-    def trendlineButtonClicked(self) -> None:
+    def toggleTrendline(self) -> None:
         '''
-        Slot for activating/deactivating a trendline
+        Shows or removes the trendline, trendlines are only shown for data on the graph
         '''
-        if self.TrendlineActive.isChecked() and self.name.isChecked():
-            x_range = self.GraphWidget.xaxis.range
-            self.setTrendline(*x_range)
-        elif not self.name.isChecked():
-            self.TrendlineActive.setChecked(False)
+        if self.trendline is None and self.checked:
+            self.setTrendline(*self.GraphWidget.xaxis.range)
         else:
             self.removeTrendline()
-
-    def colorSelectionMenu(self) -> None:
-        '''
-        Opens a QColorDialog color picker for selecting display color
-        '''
-        color = QColorDialog.getColor()
-        if color is not None:
-            self.setColor((color.red(), color.green(), color.blue()))
     
     def getColor(self) -> tuple:
         '''
         Returns current display color
         '''
-        color = self.color.palette().window().color()
-        return (color.red(), color.green(), color.blue())
-    
-    def setName(self, name: str) -> None:
-        '''
-        Set display name 
-        '''
-        self.name.setText(name)
+        return self.color
     
     def showData(self, show: bool) -> None:
         '''
         Displays the data set on the parent graph if True 
         '''
+        self.checked = show
         if show:
-            self.GraphWidget.addItem(self.PlotDataItem)
+            self.GraphWidget.addItem(self.plotItem())
+            self.updatePlotData()
         else:
-            self.GraphWidget.removeItem(self.PlotDataItem)
+            if self.PlotDataItem is not None:
+                self.GraphWidget.removeItem(self.PlotDataItem)
             self.removeTrendline()
-            self.TrendlineActive.setChecked(False)
         
     def delete(self) -> None:
         '''
-        Iterates through widgets in layout in reverse order and deletes them
+        Stops updating the data set when the graph range changes
         '''
-        for i in reversed(range(self.count())):
-            self.itemAt(i).widget().deleteLater()
-        self.deleteLater()
+        self.GraphWidget.removeRangeListener(self)
+        self.onChanged = None
 
 
 
@@ -293,10 +477,13 @@ if __name__ == '__main__':
     # Initialize application
     app = QApplication(sys.argv)
     
-    # Construct test widget
-    w = DataSelectionWidget()
-    w.layout.addLayout(DataSet('test', (255,0,0), {}))
+    # Construct test widget with a few thousand data sets
+    graph = GraphWidget()
+    w = DataSelectionWidget(graph)
+    x = np.arange(1000, dtype=np.float64)
+    w.addDataSets([(f'tag_{i}', (x, np.random.rand(1000))) for i in range(5000)])
     w.show()
+    graph.show()
 
     # Terminated when the application is closed 
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,186 @@
+import time
+
+import numpy as np
+
+
+
+class MinMaxPyramid:
+    '''
+    Multi-resolution min/max summary of a series used to draw only the points a view needs
+    Each level splits the series into buckets of factor**level samples and keeps the index
+    of the minimum and maximum sample of every bucket, so spikes stay visible at any zoom
+    x: np.ndarray = Sorted x values
+    y: np.ndarray = y values
+    factor: int = Bucket size multiplier between levels
+    '''
+    # Buckets of the first level computed per block of the series, bounds the memory used while building
+    block_buckets = 1 << 18
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, factor: int=4) -> None:
+        self.x = x
+        self.y = y
+        self.factor = factor
+
+        # levels[i] = (bucket size, min indices, max indices)
+        self.levels = []
+        self.build()
+
+    def build(self) -> None:
+        '''
+        Builds the pyramid levels, the first level is computed from the series a block at a time
+        so a memory mapped series is never loaded whole, each higher level from the one below it
+        '''
+        n = len(self.y)
+        if n <= self.factor:
+            return
+        index_dtype = np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+        # First level: the min and max of every factor samples, read in blocks of block_buckets buckets
+        buckets = -(-n // self.factor)
+        min_idx = np.empty(buckets, dtype=index_dtype)
+        max_idx = np.empty(buckets, dtype=index_dtype)
+        min_val = np.empty(buckets, dtype=np.float64)
+        max_val = np.empty(buckets, dtype=np.float64)
+        for b0 in range(0, buckets, self.block_buckets):
+            b1 = min(b0 + self.block_buckets, buckets)
+            block = np.asarray(self.y[b0*self.factor:b1*self.factor], dtype=np.float64)
+            # Pad with the last sample so the block divides evenly into buckets
+            pad = -len(block) % self.factor
+            if pad:
+                block = np.concatenate((block, np.repeat(block[-1:], pad)))
+            # NaN never wins a min or max comparison
+            nan = np.isnan(block)
+            block_min = np.where(nan, np.inf, block).reshape(-1, self.factor)
+            block_max = np.where(nan, -np.inf, block).reshape(-1, self.factor)
+            rows = np.arange(b1 - b0)
+            arg_min = np.argmin(block_min, axis=1)
+            arg_max = np.argmax(block_max, axis=1)
+            min_val[b0:b1] = block_min[rows, arg_min]
+            max_val[b0:b1] = block_max[rows, arg_max]
+            first = (b0 + rows)*self.factor
+            min_idx[b0:b1] = np.minimum(first + arg_min, n - 1)
+            max_idx[b0:b1] = np.minimum(first + arg_max, n - 1)
+        bucket = self.factor
+        self.levels.append((bucket, min_idx, max_idx))
+
+        while len(min_idx) > self.factor:
+            # Pad with the last bucket so the level divides evenly into groups
+            pad = -len(min_idx) % self.factor
+            if pad:
+                min_idx, max_idx, min_val, max_val = (
+                    np.concatenate((a, np.repeat(a[-1:], pad))) for a in (min_idx, max_idx, min_val, max_val)
+                    )
+
+            # Keep the winning sample index and value of each group
+            rows = np.arange(len(min_idx) // self.factor)
+            arg_min = np.argmin(min_val.reshape(-1, self.factor), axis=1)
+            arg_max = np.argmax(max_val.reshape(-1, self.factor), axis=1)
+            min_idx = min_idx.reshape(-1, self.factor)[rows, arg_min]
+            max_idx = max_idx.reshape(-1, self.factor)[rows, arg_max]
+            min_val = min_val.reshape(-1, self.factor)[rows, arg_min]
+            max_val = max_val.reshape(-1, self.factor)[rows, arg_max]
+            bucket *= self.factor
+            self.levels.append((bucket, min_idx, max_idx))
+
+    def nbytes(self) -> int:
+        '''
+        Returns the memory used by the pyramid levels
+        '''
+        return sum(min_idx.nbytes + max_idx.nbytes for _, min_idx, max_idx in self.levels)
+
+    def extremes(self, start: int, end: int) -> list:
+        '''
+        Returns the indices of the minimum and maximum raw samples in [start, end) in order
+        '''
+        if end <= start:
+            return []
+        y = np.asarray(self.y[start:end], dtype=np.float64)
+        if np.isnan(y).all():
+            return []
+        return sorted((start + int(np.nanargmin(y)), start + int(np.nanargmax(y))))
+
+    def query(self, x0: float, x1: float, pixels: int) -> tuple:
+        '''
+        Returns the (x, y) points to draw for the x range at a width in pixels
+        At most about two points per pixel are returned, the first and last samples
+        of the range are always included so the data bounds do not change
+        '''
+        n = len(self.x)
+        if n == 0:
+            return self.x, self.y
+
+        # Include one sample either side so lines run off the edge of the view
+        i0 = max(int(np.searchsorted(self.x, x0, side='left')) - 1, 0)
+        i1 = min(int(np.searchsorted(self.x, x1, side='right')) + 1, n)
+        # Series too short to have levels are always drawn as they are
+        if i1 - i0 <= 2*pixels or not self.levels:
+            return self.x[i0:i1], self.y[i0:i1]
+
+        # Use the finest level that gives no more than one bucket per pixel
+        bucket, min_idx, max_idx = self.levels[-1]
+        for level in self.levels:
+            if (i1 - i0)/level[0] <= pixels:
+                bucket, min_idx, max_idx = level
+                break
+
+        # Whole buckets inside the range come from the level
+        b0 = -(-i0 // bucket)
+        b1 = max(i1 // bucket, b0)
+        lo = np.minimum(min_idx[b0:b1], max_idx[b0:b1])
+        hi = np.maximum(min_idx[b0:b1], max_idx[b0:b1])
+
+        # Partial buckets at the edges of the range come from the raw samples
+        head_end = min(b0*bucket, i1)
+        head = self.extremes(i0, head_end)
+        tail = self.extremes(max(b1*bucket, head_end), i1)
+
+        # Draw the min and max of each bucket in the order they occur
+        indices = np.concatenate(
+            ([i0], head, np.column_stack((lo, hi)).ravel(), tail, [i1 - 1])
+            ).astype(np.int64)
+
+        return self.x[indices], self.y[indices]
+
+
+
+def minMaxColumns(x: np.ndarray, y: np.ndarray, pixels: int) -> tuple:
+    '''
+    Returns the (x, y) points to draw for several series sharing x at a width in pixels
+    y has one column per series, samples are split into about one bucket per pixel and
+    the min and max of every bucket are kept for all columns at once, the last samples
+    are kept as they are so the newest value is always drawn
+    Used for live data that changes too often to keep a MinMaxPyramid of
+    '''
+    n = len(x)
+    if n <= 2*pixels:
+        return x, y
+    bucket = -(-n // pixels)
+    whole = n // bucket * bucket
+    blocks = y[:whole].reshape(whole // bucket, bucket, y.shape[1])
+
+    points_y = np.empty((2*len(blocks) + n - whole, y.shape[1]), dtype=y.dtype)
+    # fmin and fmax skip NaN like the buckets of a followed LiveGraph, only all NaN buckets are gaps
+    points_y[0:2*len(blocks):2] = np.fmin.reduce(blocks, axis=1)
+    points_y[1:2*len(blocks):2] = np.fmax.reduce(blocks, axis=1)
+    points_y[2*len(blocks):] = y[whole:]
+    points_x = np.concatenate((np.repeat(x[:whole:bucket], 2), x[whole:]))
+    return points_x, points_y
+
+
+
+if __name__ == '__main__':
+    # Benchmark building and querying a pyramid for a 10M point series
+    n = 10_000_000
+    x = 1.67e9 + np.arange(n, dtype=np.float64)
+    y = np.random.rand(n).cumsum()
+
+    start = time.perf_counter()
+    pyramid = MinMaxPyramid(x, y)
+    built = time.perf_counter() - start
+    print(f'{n} points, build {built:.3f} s, {pyramid.nbytes()/1e6:.0f} MB of levels '
+          f'({(x.nbytes + y.nbytes)/1e6:.0f} MB of data)')
+
+    start = time.perf_counter()
+    for i in range(100):
+        px, py = pyramid.query(x[i*1000], x[-1], 2000)
+    print(f'Full range query: {(time.perf_counter() - start)*10:.2f} ms, {len(px)} points')
@@ -1,14 +1,20 @@
 from typing import Any
+import time
+from PyQt5.QtCore import QTimer
 import pyqtgraph as pg
+import numpy as np
 from datetime import datetime
 
+from gui_resources.decimation import MinMaxPyramid
+
 
 
 class GraphWidget(pg.PlotWidget):
     '''
     Plot widget subclass to allow for better control
+    local_time: bool = Show x values (UNIX times) as local time rather than UTC
     '''
-    def __init__(self) -> None: 
+    def __init__(self, local_time: bool=False) -> None: 
         super().__init__()
         
         # Set the graph background 
@@ -23,7 +29,7 @@ class GraphWidget(pg.PlotWidget):
         self.legend.hide()
 
         # Use custom axis for x axis
-        self.xaxis = TimeAxisItem('bottom')
+        self.xaxis = TimeAxisItem('bottom', local_time=local_time)
         self.setAxisItems({'bottom': self.xaxis})
 
         # Set axis labels
@@ -35,6 +41,26 @@ class GraphWidget(pg.PlotWidget):
         self.getAxis('left').setTextPen('black')
         self.getAxis('bottom').setPen('black')
         self.getAxis('bottom').setTextPen('black')
+
+        # Objects updated when the view range changes, see addRangeListener
+        self.rangeListeners = []
+
+        # Range changes are coalesced so listeners are updated at most once per frame
+        self.rangeEventsReceived = 0
+        self.rangeEventsHandled = 0
+        self.RangeTimer = QTimer()
+        self.RangeTimer.setSingleShot(True)
+        self.RangeTimer.setInterval(16)
+        self.RangeTimer.timeout.connect(self.dispatchRangeChange)
+        self.sigRangeChanged.connect(self.scheduleRangeChange)
+
+        # Seconds the last paint took, used to budget redraws of live graphs
+        self.paintTime = 0.0
+
+    def paintEvent(self, ev: Any) -> None:
+        start = time.perf_counter()
+        super().paintEvent(ev)
+        self.paintTime = time.perf_counter() - start
     
     def showLegend(self, show: bool) -> None:
         '''
@@ -45,6 +71,57 @@ class GraphWidget(pg.PlotWidget):
         else:
             self.legend.hide()
 
+    def addRangeListener(self, listener: Any) -> None:
+        '''
+        Registers an object to update when the view range changes
+        The listener needs isShown() -> bool and rangeChanged(x0, x1, pixels) methods,
+        hidden listeners are skipped
+        '''
+        self.rangeListeners.append(listener)
+
+    def removeRangeListener(self, listener: Any) -> None:
+        '''
+        Stops updating an object when the view range changes
+        '''
+        if listener in self.rangeListeners:
+            self.rangeListeners.remove(listener)
+
+    def scheduleRangeChange(self) -> None:
+        '''
+        Slot for range changes, schedules one dispatch for the next frame
+        Further range changes before the dispatch runs are coalesced into it
+        '''
+        self.rangeEventsReceived += 1
+        if not self.RangeTimer.isActive():
+            self.RangeTimer.start()
+
+    def dispatchRangeChange(self) -> None:
+        '''
+        Updates all shown listeners for the current view range in one batch
+        '''
+        self.rangeEventsHandled += 1
+        x0, x1 = self.getViewBox().viewRange()[0]
+        pixels = self.viewPixelWidth()
+        for listener in list(self.rangeListeners):
+            if listener.isShown():
+                listener.rangeChanged(x0, x1, pixels)
+
+    def rangeEventCounts(self) -> dict:
+        '''
+        Returns the number of range changes received, handled and coalesced for profiling
+        '''
+        return {
+            'received': self.rangeEventsReceived,
+            'handled': self.rangeEventsHandled,
+            'coalesced': self.rangeEventsReceived - self.rangeEventsHandled
+            }
+
+    def viewPixelWidth(self) -> int:
+        '''
+        Returns the width of the plotting area in pixels
+        '''
+        return max(int(self.getViewBox().width()), 1)
+
 
 
 class TimeAxisItem(pg.AxisItem):
@@ -52,9 +129,11 @@ class TimeAxisItem(pg.AxisItem):
     Axis item subclass to allow display of date/time format
     Can pass a string format to use for display 
     i.e. '%d.%m.%Y %H:%M:%S' or '%Y/%m/%d %H:%M'
+    Values are shown as UTC unless local_time is set, for live data logged with real UNIX times
     '''
-    def __init__(self, placement: Any, datetime_format: str=None) -> None:
+    def __init__(self, placement: Any, datetime_format: str=None, local_time: bool=False) -> None:
         super(TimeAxisItem, self).__init__(placement)
+        self.local_time = local_time
 
         # Better display of large numbers
         self.enableAutoSIPrefix(False)
@@ -73,6 +152,56 @@ class TimeAxisItem(pg.AxisItem):
             # May need to change the fromtimestamp function depending on timezone issues
             # utcfromtimestamp
             # fromtimestamp
+            if self.local_time:
+                return [str(datetime.fromtimestamp(value).strftime(self.str_format)) for value in values]
             return [str(datetime.utcfromtimestamp(value).strftime(self.str_format)) for value in values]
         except:
-            return []
\ No newline at end of file
+            return []
+
+
+
+class DecimatedPlotDataItem(pg.PlotDataItem):
+    '''
+    Plot data item for large series that only draws the points needed for the current view
+    A min/max pyramid of the full series is built the first time it is drawn, the data bounds
+    used for auto ranging always come from the full series rather than the drawn points
+    x: np.ndarray = Sorted x values
+    y: np.ndarray = y values
+    '''
+    def __init__(self, x: np.ndarray, y: np.ndarray, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.x = x
+        self.y = y
+        self.pyramid = None
+
+    def getPyramid(self) -> MinMaxPyramid:
+        '''
+        Returns the min/max pyramid of the series, building it if needed
+        '''
+        if self.pyramid is None:
+            self.pyramid = MinMaxPyramid(self.x, self.y)
+        return self.pyramid
+
+    def setViewRange(self, x0: float, x1: float, pixels: int) -> None:
+        '''
+        Draws the points needed for the x range at a width in pixels
+        '''
+        x, y = self.getPyramid().query(x0, x1, pixels)
+        self.setData(x, y)
+
+    def dataBounds(self, ax: int, frac: float=1.0, orthoRange: tuple=None) -> tuple:
+        '''
+        Returns the bounds of the full series for auto ranging
+        The y bounds are limited to orthoRange (an x range) when it is given
+        '''
+        if len(self.x) == 0:
+            return (None, None)
+        if ax == 0:
+            return (self.x[0], self.x[-1])
+
+        # The decimated points of a range keep its min and max samples
+        x0, x1 = (self.x[0], self.x[-1]) if orthoRange is None else orthoRange
+        _, y = self.getPyramid().query(x0, x1, 256)
+        if len(y) == 0 or np.isnan(y).all():
+            return (None, None)
+        return (np.nanmin(y), np.nanmax(y))
\ No newline at end of file
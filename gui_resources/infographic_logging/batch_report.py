@@ -0,0 +1,175 @@
+from gui_resources.infographic_logging.infographic import Infographic, InfographicRenderer, load_project_json
+from gui_resources.infographic_logging.data_object import read_log, convert_pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib.pyplot as plt
+import pandas as pd
+import argparse
+import time
+import os
+
+# Headless batch rendering of infographics for many projects and date ranges
+# Run from the directory holding the Infographic Settings folder and the project logs
+# saved by Data (<project name>.parquet), i.e.
+#   python -m gui_resources.infographic_logging.batch_report --month 2022-07 --month 2022-08 --format pdf
+# Every report is rendered in a worker process that reuses one figure for all of its reports and a summary of
+# the per-report timings is printed and written to summary.csv in the output folder
+
+
+
+# Figure reused by every report of this worker process
+renderer = None
+
+# Sets up a worker process, reports are only written to files so no GUI backend is needed
+def init_worker():
+
+    global renderer
+    plt.switch_backend('Agg')
+    renderer = InfographicRenderer()
+
+# Returns the project numbers that have a json in the Infographic Settings folder
+def list_projects():
+
+    projects = []
+    for file_name in os.listdir('Infographic Settings'):
+        name = file_name.split('.')[0]
+        if name.isnumeric():
+            projects.append(int(name))
+    return sorted(projects)
+
+# Returns the saved data of a project in the time range [start, end) without prompting for a file
+# when it is missing, only the months in the range are read
+def project_log(pnumber, start=None, end=None):
+
+    df = read_log(load_project_json(pnumber)['project_name'], start, end)
+    if df is None:
+        raise FileNotFoundError(f'No saved log for project {pnumber}')
+    return df
+
+# Converts logs still saved as a pickle by earlier versions before the workers read them
+def convert_logs(projects):
+
+    for project in projects:
+        try:
+            name = load_project_json(project)['project_name']
+            if os.path.exists(name + '.pickle'):
+                convert_pickle(name)
+        except Exception as ex:
+            print("Error during converting log: ", ex)
+
+# Returns the (label, start, end) date ranges of a list of months (YYYY-MM)
+def month_ranges(months):
+
+    ranges = []
+    for month in months:
+        start = pd.Timestamp(month + '-01')
+        ranges.append((month, start, start + pd.DateOffset(months=1)))
+    return ranges
+
+# Renders one report, runs in a worker process
+# Errors are returned in the summary instead of stopping the rest of the batch
+def render_job(job):
+
+    start_time = time.perf_counter()
+    error = ''
+    rows = 0
+    try:
+        df = project_log(job['project'], job['start'], job['end'])
+        rows = len(df)
+        if rows == 0:
+            raise ValueError('No data in date range')
+        Infographic.render(job['project'], df, job['path'],
+                           plots=job['plots'], bubbles=job['bubbles'], renderer=renderer,
+                           full_resolution=job['full_resolution'])
+    except Exception as ex:
+        error = f'{type(ex).__name__}: {ex}'
+
+    return {
+        'project': job['project'],
+        'range': job['label'],
+        'rows': rows,
+        'seconds': round(time.perf_counter() - start_time, 2),
+        'path': job['path'] if not error else '',
+        'error': error
+        }
+
+# Renders a report for every project and date range in parallel
+# ranges are (label, start, end) tuples, a start of None uses the whole log
+# Returns the summary data frame with one row per report
+def render_batch(projects, ranges, output_dir, plots=(), bubbles=None, format='png', processes=None,
+                 full_resolution=False):
+
+    os.makedirs(output_dir, exist_ok=True)
+    convert_logs(projects)
+    jobs = []
+    for project in projects:
+        for label, start, end in ranges:
+            jobs.append({
+                'project': project,
+                'label': label,
+                'start': start,
+                'end': end,
+                'path': os.path.join(output_dir, f'{project}_{label}.{format}'),
+                'plots': list(plots),
+                'bubbles': bubbles,
+                'full_resolution': full_resolution
+                })
+
+    start_time = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker) as pool:
+        futures = [pool.submit(render_job, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = result['error'] if result['error'] else result['path']
+            print(f"[{len(results)}/{len(jobs)}] {result['project']} {result['range']}: {result['seconds']} s  {status}")
+    wall_time = time.perf_counter() - start_time
+
+    summary = pd.DataFrame(results, columns=['project', 'range', 'rows', 'seconds', 'path', 'error'])
+    summary = summary.sort_values(['project', 'range']).reset_index(drop=True)
+    summary.to_csv(os.path.join(output_dir, 'summary.csv'), index=False)
+
+    print(summary.to_string(index=False))
+    print(f"{len(jobs)} reports, {(summary['error'] == '').sum()} written, "
+          f"{summary['seconds'].sum():.1f} s of rendering in {wall_time:.1f} s")
+    return summary
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render infographics for many projects and date ranges')
+    parser.add_argument('--project', type=int, action='append',
+                        help='Project number, repeat for several (default: every project json)')
+    parser.add_argument('--month', action='append', default=[],
+                        help='Month to report (YYYY-MM), repeat for several')
+    parser.add_argument('--range', nargs=2, action='append', default=[], metavar=('START', 'END'),
+                        help='Date range to report, end exclusive, repeat for several')
+    parser.add_argument('--plot', action='append', default=[],
+                        help='Plot to add from the project json, repeat for several')
+    parser.add_argument('--bubble', action='append',
+                        help='Bubble to add, repeat for several (default: every bubble in bubbles.json)')
+    parser.add_argument('--full-resolution', action='store_true',
+                        help='Draw every sample of the plots instead of one sample per pixel cell plus the minimum and maximum')
+    parser.add_argument('--format', default='png', choices=['png', 'pdf', 'svg'])
+    parser.add_argument('--output', default='Reports', help='Folder the reports are written to')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    ranges = month_ranges(args.month)
+    for start, end in args.range:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        ranges.append((f'{start:%Y%m%d}-{end:%Y%m%d}', start, end))
+    if not ranges:
+        ranges = [('all', None, None)]
+
+    render_batch(
+        args.project or list_projects(),
+        ranges,
+        args.output,
+        plots=args.plot,
+        bubbles=args.bubble,
+        format=args.format,
+        processes=args.processes,
+        full_resolution=args.full_resolution
+        )
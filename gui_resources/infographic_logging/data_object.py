@@ -1,27 +1,32 @@
 import pandas as pd
+import numpy as np
 import pickle
 import os
 import json
 # Data object for saving pandas dataframes
+# The log of a project is kept as one Parquet file per month in the "<project name>.parquet" folder,
+# so saving new data only rewrites the months it falls in and loading a time range only reads those months
 class Data():
 
     # initialize by loading file
-    def __init__(self, number):
+    # start and end (end exclusive) limit the loaded data to a time range, None loads the whole log
+    def __init__(self, number, start=None, end=None):
         self.number = number
         self.dic = load_project_json(number)
         self.name = self.dic['project_name']
+        self.start = start
+        self.end = end
         file = self.load()
         if file is None:
             filename = input("File Name: ")
             df = pd.read_csv(filename, delimiter=';', low_memory=False, decimal=',')
             df = pd.DataFrame.dropna(df)
             df['TimeString'] = pd.to_datetime(df['TimeString'], format='%d.%m.%Y %H:%M:%S')
-            self.M = df.drop(columns=['Time_ms', 'Validity'])
+            self.M = clean_log(df.drop(columns=['Time_ms', 'Validity']))
             self.save()
             os.remove(filename)
         else:
             self.M = file
-            self.save()
     # blank function that returns dataframe
 
     def display(self):
@@ -43,43 +48,181 @@ class Data():
         return self.M
 
     # merges current data frame with new data, deletes repeats
+    # Only the months the new data falls in are read and written, new samples replace stored duplicates
+    # and only the stored samples from the first new timestamp on are sorted again
     def merge(self,filename):
 
-        df = pd.read_csv(filename, delimiter=';', low_memory=False, decimal=',')
-        df['TimeString'] = pd.to_datetime(df['TimeString'], format='%d.%m.%Y %H:%M:%S')
-        df = df.drop(columns=['Time_ms', 'Validity'])
-        self.M = pd.concat([df, self.M], axis=0, copy=False)
-        self.clean()
-        os.remove(filename)
-        self.save()
+        df = merge_file(self.name, filename)
+
+        # Add the new data in the loaded time range to the loaded data
+        self.M = merge_log(self.M, in_range(df, self.start, self.end))
         return self.M
 
     # saves dataframe
+    # Writes every month of the loaded data, stored data outside the loaded time range is kept
     def save(self):
 
         try:
-            with open(self.name + ".pickle", "wb") as f:
-                pickle.dump(self.M, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for month, df in self.M.groupby(month_keys(self.M), sort=False):
+                if self.start is not None or self.end is not None:
+                    old = read_partition(self.name, month)
+                    outside = old.drop(in_range(old, self.start, self.end).index)
+                    df = pd.concat([df, outside], axis=0, copy=False).sort_values(by="TimeString", kind='stable')
+                write_partition(self.name, month, df)
         except Exception as ex:
-            print("Error during pickling object (Possibly unsupported): ", ex)
+            print("Error during saving log (Possibly unsupported): ", ex)
 
     # loads dataframe
+    # Logs saved as a pickle by earlier versions are converted to the partitioned log first
     def load(self):
 
         try:
-            with open(self.name + '.pickle', "rb") as f:
-                return pickle.load(f)
+            if os.path.exists(self.name + '.pickle'):
+                convert_pickle(self.name)
+            return read_log(self.name, self.start, self.end)
         except Exception as ex:
-            print("Error during unpickling object (Possibly unsupported): ", ex)
+            print("Error during loading log (Possibly unsupported): ", ex)
 
+    # sorts the data by time and returns it pivoted by tag, the saved log keeps its long format
     def sort(self):
         self.M.sort_values(by="TimeString", inplace=True)
-        self.M = pd.pivot_table(data=self.M, index=['VarName', 'TimeString'])
         self.save()
+        self.M = pd.pivot_table(data=self.M, index=['VarName', 'TimeString'])
     def dispname(self):
         return self.name
 
 
+# Folder holding the monthly Parquet files of a project log
+def log_path(name):
+
+    return name + '.parquet'
+
+# Location of the Parquet file of one month (YYYY-MM) of a project log
+def partition_path(name, month):
+
+    return os.path.join(log_path(name), month + '.parquet')
+
+# Returns the months stored for a project log
+def log_months(name):
+
+    if not os.path.isdir(log_path(name)):
+        return []
+    return sorted(file[:-8] for file in os.listdir(log_path(name)) if file.endswith('.parquet'))
+
+# Returns the month (YYYY-MM) of every row of a log, the name of the file it is stored in
+def month_keys(df):
+
+    months = df['TimeString'].to_numpy().astype('datetime64[M]')
+    return np.datetime_as_string(months, unit='M')
+
+# Returns the rows of a data frame in the time range [start, end), None leaves a side open
+def in_range(df, start=None, end=None):
+
+    if start is not None:
+        df = df[df['TimeString'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['TimeString'] < pd.Timestamp(end)]
+    return df
+
+# Drops incomplete rows and repeated samples, the first of repeated samples is kept, and sorts by time
+def clean_log(df):
+
+    df = pd.DataFrame.dropna(df)
+    df = df.drop_duplicates(subset = ['TimeString','VarName'])
+    return df.sort_values(by="TimeString", kind='stable').reset_index(drop=True)
+
+# Merges new samples into a cleaned log, the same as clean_log(pd.concat([new, log])) but only the
+# new samples and the samples of the log from the first new timestamp on are deduplicated and sorted
+# Downloads overlap the end of the log, so this is usually a short tail and the rest is kept as it is
+def merge_log(log, new):
+
+    new = clean_log(new)
+    if len(new) == 0:
+        return log
+    if len(log) == 0:
+        return new
+    split = log['TimeString'].searchsorted(new['TimeString'].iloc[0], side='left')
+    if split == len(log):
+        return pd.concat([log, new], axis=0, ignore_index=True, copy=False)
+    tail = clean_log(pd.concat([new, log.iloc[split:]], axis=0, copy=False))
+    return pd.concat([log.iloc[:split], tail], axis=0, ignore_index=True, copy=False)
+
+# Reads one month of a project log, empty when the month is not stored
+def read_partition(name, month, filters=None):
+
+    path = partition_path(name, month)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['VarName', 'TimeString', 'VarValue'])
+    return pd.read_parquet(path, filters=filters)
+
+# Writes one month of a project log, replacing the stored month
+# The file is written next to the old one and swapped in so an interrupted save never loses the month
+def write_partition(name, month, df):
+
+    os.makedirs(log_path(name), exist_ok=True)
+    path = partition_path(name, month)
+    df.to_parquet(path + '.tmp', index=False, row_group_size=100_000)
+    os.replace(path + '.tmp', path)
+
+# Reads the project log in the time range [start, end), None leaves a side open
+# Only the months overlapping the range are opened and rows outside it are filtered while reading,
+# returns None when the project has no log
+def read_log(name, start=None, end=None):
+
+    months = log_months(name)
+    if not months:
+        return None
+
+    filters = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        months = [month for month in months if month >= f'{start:%Y-%m}']
+        filters.append(('TimeString', '>=', start))
+    if end is not None:
+        end = pd.Timestamp(end)
+        months = [month for month in months if pd.Timestamp(month + '-01') < end]
+        filters.append(('TimeString', '<', end))
+
+    frames = [read_partition(name, month, filters or None) for month in months]
+    if not frames:
+        return read_partition(name, '')
+    return pd.concat(frames, axis=0, ignore_index=True, copy=False)
+
+# Converts a log saved as "<project name>.pickle" by earlier versions into monthly Parquet files
+# The log is cleaned once so the stored months are sorted and without repeats, months already stored
+# (from an interrupted conversion) are merged with stored samples kept over the pickled ones
+# The pickle is renamed to "<project name>.pickle.converted" afterwards so it is not read or converted again
+def convert_pickle(name):
+
+    with open(name + '.pickle', 'rb') as f:
+        df = pickle.load(f)
+    if 'TimeString' not in df.columns:
+        df = df.reset_index()  # Saved after sort() as a pivot table
+    df = clean_log(df)
+    for month, part in df.groupby(month_keys(df), sort=False):
+        write_partition(name, month, merge_log(part, read_partition(name, month)))
+    os.replace(name + '.pickle', name + '.pickle.converted')
+
+# Merges a downloaded HMI log file into the stored months of a project log and removes the file
+# Only the months the file has samples in are read and written, the rest of the log is not loaded
+# Returns the samples of the file
+def merge_file(name, filename):
+
+    if os.path.exists(name + '.pickle'):
+        convert_pickle(name)
+
+    df = pd.read_csv(filename, delimiter=';', low_memory=False, decimal=',')
+    df = pd.DataFrame.dropna(df)
+    df['TimeString'] = pd.to_datetime(df['TimeString'], format='%d.%m.%Y %H:%M:%S')
+    df = df.drop(columns=['Time_ms', 'Validity'])
+
+    # Merge each month of new data with the stored month
+    for month, new in df.groupby(month_keys(df), sort=False):
+        old = read_partition(name, month)
+        write_partition(name, month, merge_log(old, new))
+    os.remove(filename)
+    return df
+
 # Example for loading the json
 def load_project_json(proj_number: int) -> dict:
     # Location of the project's json
@@ -94,6 +237,33 @@ def load_project_json(proj_number: int) -> dict:
 
 
 if __name__ == '__main__':
+    # Check merge_log against clean_log(pd.concat([new, log])) for new samples that overlap the log,
+    # are older than all of it, repeat log samples or each other, are out of order or incomplete
+    rng = np.random.default_rng(0)
+    def random_log(rows, start, span):
+        return pd.DataFrame({
+            'VarName': rng.choice(['PT305', 'FT501', 'TT101'], rows),
+            'TimeString': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(start, start + span, rows), unit='min'),
+            'VarValue': np.where(rng.random(rows) < 0.05, np.nan, rng.random(rows))
+            })
+    cases = {
+        'overlapping': lambda: random_log(50, 800, 400),
+        'older': lambda: random_log(50, -500, 400),
+        'duplicate': lambda: pd.concat([log.sample(20, random_state=1), log.sample(20, random_state=1)]),
+        'unsorted': lambda: random_log(50, 0, 1200).sample(frac=1, random_state=2),
+        'after': lambda: random_log(50, 1000, 200),
+        'empty': lambda: random_log(0, 0, 1)
+        }
+    for case, make_new in cases.items():
+        for trial in range(50):
+            log = clean_log(random_log(200, 0, 1000))
+            new = make_new()
+            if case == 'duplicate':
+                new['VarValue'] = rng.random(len(new))
+            expected = clean_log(pd.concat([new, log]))
+            pd.testing.assert_frame_equal(merge_log(log, new).reset_index(drop=True), expected)
+    print(f'merge_log matches clean_log(concat) for {", ".join(cases)} new samples')
+
     file = Data(607)
     file.clean()
     print(file.display())
\ No newline at end of file
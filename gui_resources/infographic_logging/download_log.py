@@ -1,27 +1,25 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from http.cookiejar import CookieJar
+from http.client import HTTPException
+from urllib.parse import urljoin, urlencode
+from urllib.error import HTTPError, URLError
+import urllib.request
 from dotenv import load_dotenv, find_dotenv
-import sys
+import argparse
+import json
 import time
 import os
 
 # Custom library imports
-from data_object import Data
+from data_object import merge_file, load_project_json
 
 
 
 # Load hidden variables
 load_dotenv(find_dotenv())
 
-# VPN log in page
-stridelinx_address = 'www.stridelinx.com/portal/login?next=%2Fdevices'
-# Username for StridLinx account
-stridelinx_username = os.getenv('stridelinx_username')
-# Password for StrideLinx account
-stridelinx_password = os.getenv('stridelinx_password')
+# The HMI is reached through the StrideLinx VPN, the VPN connection has to be up before downloading
 
 
 # HMI address
@@ -31,100 +29,200 @@ hmi_username = os.getenv('HMI_USERNAME')
 # Password for log in
 hmi_password = os.getenv('HMI_PASSWORD')
 
+# Page of the HMI web server listing the log files on the USB storage
+# Open the HMI's file browser in a web browser and copy the path of the USB storage page if it differs,
+# the default has not been checked against the HMI (set HMI_BROWSER_PATH or pass --browser-path)
+file_browser_path = os.getenv('HMI_BROWSER_PATH', '/StorageCardUSB/')
+
 
 # Names of files to download
 csv_names = ['System_Sensor_log0.csv']
 
+# Size of the pieces files are downloaded and written in
+chunk_size = 64*1024
 
 
-def download_log(args):
-    # Custom function for waiting for elements to load 
-    def load_then_click(element_type, element_path):
-        try:
-            element = WebDriverWait(driver, 20).until(
-                EC.presence_of_element_located((element_type, element_path))
-            )
-            element.click()
-        except Exception as e:
-            print(e)
-
-    # Waits until all downloads are completed
-    # File names will have '.crdownload' file type until download is fully complete
-    def wait_for_downloads():
-        while any([filename.endswith(".crdownload") for filename in
-                os.listdir(download_path)]):
-            time.sleep(2)
 
-    # Download files to the current working directory
-    download_path = os.getcwd()
+# Collects the forms and links of an HMI web page
+class PageParser(HTMLParser):
 
-    # Start a service using the Chrome driver
-    service = Service(executable_path='chromedriver_win32/chromedriver.exe')
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.links = {}
+        self.link = None
 
-    # Options for the service
-    # Sets the Chrome download path
-    options = webdriver.ChromeOptions()
-    options.add_experimental_option('detach', True)
-    prefs = {"download.default_directory": download_path}
-    options.add_experimental_option("prefs", prefs)
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form':
+            self.forms.append({'action': attrs.get('action', ''), 'method': attrs.get('method', 'get').lower(),
+                               'inputs': {}})
+        elif tag == 'input' and self.forms and attrs.get('name'):
+            self.forms[-1]['inputs'][attrs['name']] = attrs.get('value', '')
+        elif tag == 'a' and 'href' in attrs:
+            self.link = [attrs['href'], '']
 
-    # Initialize web driver
-    driver = webdriver.Chrome(service=service, options=options)
+    def handle_data(self, data):
+        if self.link is not None:
+            self.link[1] += data
 
-    # Navigate to VPN page
-    driver.get(f'http://{stridelinx_address}')
+    def handle_endtag(self, tag):
+        if tag == 'a' and self.link is not None:
+            self.links[self.link[1].strip()] = self.link[0]
+            self.link = None
 
-    username_field = driver.find_element(By.XPATH("//input[@name='emailAddress' and @placeholder='E-mail address']"))
-    username_field.send_keys(stridelinx_username)
 
-    password_field = driver.find_element(By.NAME, 'Password')
-    password_field.send_keys(stridelinx_password)
+# Logged in connection to the HMI web server
+# The session cookie is shared by every download thread
+class HMISession():
 
+    def __init__(self, address, username, password, timeout=30):
+        self.base = address if address.startswith('http') else f'http://{address}'
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
 
-    # Navigate to HMI webserver
-    driver.get(f'http://{hmi_address}')
+    # Opens a page or file of the web server, path may be relative to the server or a full url
+    def open(self, path, data=None, headers=None):
 
-    # Enter login name
-    username_field = driver.find_element(By.NAME, 'Login')
-    username_field.send_keys(hmi_username)
+        request = urllib.request.Request(urljoin(self.base, path), data=data, headers=headers or {})
+        return self.opener.open(request, timeout=self.timeout)
 
-    # Enter password
-    password_field = driver.find_element(By.NAME, 'Password')
-    password_field.send_keys(hmi_password)
+    # Returns the parsed forms and links of a page
+    def page(self, path):
 
-    # Click the login button
-    load_then_click(By.XPATH, '/html/body/table[2]/tbody/tr/td[1]/table/tbody/tr[1]/td/form/table/tbody/tr[3]/td/input')
+        with self.open(path) as response:
+            parser = PageParser()
+            parser.feed(response.read().decode('utf-8', errors='replace'))
+            return parser
 
-    # Click the file browser button
-    load_then_click(By.XPATH, '/html/body/table[2]/tbody/tr/td[1]/table/tbody/tr[11]/td[3]/a')
+    # Submits the login form of the start page
+    def login(self):
 
-    # Click the USB storage button
-    load_then_click(By.XPATH, '/html/body/table[2]/tbody/tr/td[3]/table[2]/tbody/tr[9]/td[2]/a/b/font')
+        for form in self.page('/').forms:
+            if 'Login' in form['inputs']:
+                fields = dict(form['inputs'], Login=self.username, Password=self.password)
+                data = urlencode(fields).encode()
+                with self.open(form['action'] or '/', data=data) as response:
+                    response.read()
+                return
+        raise ValueError('No login form on the HMI start page')
 
-    # Iterate through file names and click each download link
-    for name in csv_names:
-        load_then_click(By.XPATH, f"//a[text()='{name}']")
+    # Returns the url of every file listed on the file browser page by file name
+    def list_files(self, path=file_browser_path):
 
-    # Display downloads page
-    driver.get("chrome://downloads/")
+        return {name: urljoin(urljoin(self.base, path), href) for name, href in self.page(path).links.items()}
 
-    # Used to wait until download is complete
-    # paths = WebDriverWait(driver, 600, 1).until(finish_downloads)
-    wait_for_downloads()
 
-    # Ends the session by closing all windows and terminating the driver
-    driver.quit()
+# Downloads a file to path, continuing a partial download left by an earlier attempt
+# The file is written as path + '.part' and only renamed to path once complete, the validator of the
+# server's copy is kept next to it so a changed file is downloaded again instead of being appended to
+def fetch_file(session, url, path, retries=5):
 
-    # Merge the downloaded data into the database
-    file = Data(607)
-    file.merge(csv_names[0])
+    part = path + '.part'
+    info = path + '.part.json'
+    for attempt in range(retries + 1):
+        try:
+            # Ask for the rest of the file if part of it is already here
+            size = os.path.getsize(part) if os.path.exists(part) else 0
+            headers = {}
+            if size and os.path.exists(info):
+                with open(info, 'r') as json_file:
+                    validator = json.load(json_file).get('validator')
+                headers['Range'] = f'bytes={size}-'
+                if validator:
+                    headers['If-Range'] = validator
+
+            try:
+                response = session.open(url, headers=headers)
+            except HTTPError as ex:
+                # Nothing left to download
+                if ex.code == 416 and size:
+                    os.replace(part, path)
+                    os.remove(info)
+                    return path
+                raise
+
+            with response:
+                # 206 continues the partial file, anything else is the whole file
+                resumed = response.status == 206
+                validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                with open(info, 'w') as json_file:
+                    json.dump({'url': url, 'validator': validator}, json_file)
+
+                length = response.headers.get('Content-Length')
+                expected = (size if resumed else 0) + int(length) if length is not None else None
+                with open(part, 'ab' if resumed else 'wb') as f:
+                    while True:
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+
+            if expected is not None and os.path.getsize(part) != expected:
+                raise URLError(f'Connection closed after {os.path.getsize(part)} of {expected} bytes')
+            os.replace(part, path)
+            os.remove(info)
+            return path
+
+        except (URLError, HTTPException, OSError) as ex:
+            # Client errors (missing file, not logged in) do not go away by trying again
+            if attempt == retries or (isinstance(ex, HTTPError) and ex.code < 500):
+                raise
+            print(f"Error downloading {os.path.basename(path)}, retrying: ", ex)
+            time.sleep(min(2**attempt, 30))
+
+
+# Downloads the log files from the HMI in parallel and merges each one into the project's data as it arrives
+# Files are merged one at a time by the calling thread while the others are still downloading
+# Returns the names of the merged files
+def download_log(names=csv_names, address=hmi_address, username=hmi_username, password=hmi_password,
+                 project=607, workers=3, download_path=None, merge=True, browser_path=file_browser_path):
 
+    # Download files to the current working directory
+    download_path = os.getcwd() if download_path is None else download_path
+
+    session = HMISession(address, username, password)
+    session.login()
+    files = session.list_files(browser_path)
+    missing = [name for name in names if name not in files]
+    if missing:
+        print("Error files not found on the HMI: ", missing)
+
+    # Only the months the downloaded files cover are read from the project log
+    project_name = load_project_json(project)['project_name'] if merge else None
+    merged = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_file, session, files[name], os.path.join(download_path, name)): name
+                   for name in names if name in files}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                path = future.result()
+            except Exception as ex:
+                print(f"Error downloading {name}: ", ex)
+                continue
+            print(f'Downloaded {name}')
+
+            # Merge the downloaded data into the database
+            if project_name is not None:
+                merge_file(project_name, path)
+            merged.append(name)
+    return merged
 
 
-if __name__ == '__main__':
 
-    download_log(sys.argv)
-    print(stridelinx_username)
-    print(stridelinx_password)
-    print(hmi_username)
-    print(hmi_password)
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download log files from the HMI and merge them into the project log')
+    parser.add_argument('names', nargs='*', default=csv_names, help='Log files to download')
+    parser.add_argument('--address', default=hmi_address, help='HMI address, i.e. 192.168.0.102 or http://localhost:8000')
+    parser.add_argument('--project', type=int, default=607)
+    parser.add_argument('--workers', type=int, default=3, help='Number of files downloaded at once')
+    parser.add_argument('--no-merge', action='store_true', help='Only download the files')
+    parser.add_argument('--browser-path', default=file_browser_path,
+                        help='Path of the HMI web server page listing the USB storage files')
+    args = parser.parse_args()
+
+    download_log(args.names, args.address, project=args.project, workers=args.workers, merge=not args.no_merge,
+                 browser_path=args.browser_path)
@@ -0,0 +1,161 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, unquote
+from email.utils import formatdate
+import argparse
+import secrets
+import time
+import os
+
+# Stand-in for the HMI web server, used to try download_log without the VPN or the HMI
+# Serves a login form, a file browser page listing the files of a folder and the files themselves,
+# with Range requests, and can drop connections part way through a file to try resuming, i.e.
+#   python hmi_test_server.py "Test Logs" --port 8000 --drop-after 1000000
+#   python download_log.py --address http://localhost:8000 --no-merge
+
+
+
+class HMIHandler(BaseHTTPRequestHandler):
+
+    # Set by serve()
+    folder = '.'
+    browser_path = '/StorageCardUSB/'
+    username = None
+    password = None
+    drop_after = None
+    delay = 0
+    sessions = set()
+
+    # Start page with the login form
+    def login_page(self):
+
+        self.send_page('<html><body><table></table><table><tr><td><table><tr><td>'
+                       '<form action="/FormLogin" method="post">'
+                       '<input type="hidden" name="Redirection" value="/">'
+                       '<table><tr><td><input type="text" name="Login"></td></tr>'
+                       '<tr><td><input type="password" name="Password"></td></tr>'
+                       '<tr><td><input type="submit" value="Login"></td></tr></table>'
+                       '</form></td></tr></table></td></tr></table></body></html>')
+
+    # File browser page with a link to every file in the folder
+    def browser_page(self):
+
+        links = ''.join(f'<tr><td><a href="{name}">{name}</a></td><td>{os.path.getsize(os.path.join(self.folder, name))}</td></tr>'
+                        for name in sorted(os.listdir(self.folder)))
+        self.send_page(f'<html><body><table>{links}</table></body></html>')
+
+    def send_page(self, html):
+
+        body = html.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def logged_in(self):
+
+        cookie = self.headers.get('Cookie', '')
+        return any(part.strip() in self.sessions for part in cookie.split(';'))
+
+    def do_POST(self):
+
+        fields = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        if fields.get('Login', [None])[0] == self.username and fields.get('Password', [None])[0] == self.password:
+            session = f'session={secrets.token_hex(8)}'
+            self.sessions.add(session)
+            self.send_response(302)
+            self.send_header('Set-Cookie', session + '; Path=/')
+        else:
+            self.send_response(302)
+        self.send_header('Location', fields.get('Redirection', ['/'])[0])
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+
+        path = unquote(self.path)
+        if path == '/':
+            return self.login_page()
+        if not self.logged_in():
+            return self.send_error(403)
+        if path == self.browser_path:
+            return self.browser_page()
+        if not path.startswith(self.browser_path):
+            return self.send_error(404)
+
+        file = os.path.join(self.folder, os.path.basename(path))
+        if not os.path.isfile(file):
+            return self.send_error(404)
+        self.send_file(file)
+
+    # Sends a file or the requested range of it
+    def send_file(self, file):
+
+        stat = os.stat(file)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+
+        # Only honour the range if the client's copy is of the same file
+        start = 0
+        requested = self.headers.get('Range')
+        if requested and self.headers.get('If-Range', etag) in (etag, formatdate(stat.st_mtime, usegmt=True)):
+            start = int(requested.split('=')[1].split('-')[0])
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(size - start))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(stat.st_mtime, usegmt=True))
+        self.end_headers()
+
+        # Send the file, dropping the connection after drop_after bytes if set
+        sent = 0
+        with open(file, 'rb') as f:
+            f.seek(start)
+            while True:
+                chunk = f.read(64*1024)
+                if not chunk:
+                    break
+                if self.drop_after is not None and sent + len(chunk) > self.drop_after:
+                    self.wfile.write(chunk[:self.drop_after - sent])
+                    self.close_connection = True
+                    return
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                time.sleep(self.delay)
+
+
+# Serves the files of a folder until interrupted
+def serve(folder, port=8000, username=None, password=None, drop_after=None, delay=0):
+
+    HMIHandler.folder = folder
+    HMIHandler.username = username
+    HMIHandler.password = password
+    HMIHandler.drop_after = drop_after
+    HMIHandler.delay = delay
+    server = ThreadingHTTPServer(('localhost', port), HMIHandler)
+    print(f'Serving {folder} on http://localhost:{port}')
+    server.serve_forever()
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in HMI web server for testing download_log')
+    parser.add_argument('folder', help='Folder of log files to serve')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--username', default=os.getenv('HMI_USERNAME'))
+    parser.add_argument('--password', default=os.getenv('HMI_PASSWORD'))
+    parser.add_argument('--drop-after', type=int, default=None,
+                        help='Close the connection after this many bytes of every response')
+    parser.add_argument('--delay', type=float, default=0, help='Seconds to wait after every 64 kB sent')
+    args = parser.parse_args()
+
+    serve(args.folder, args.port, args.username, args.password, args.drop_after, args.delay)
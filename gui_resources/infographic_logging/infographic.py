@@ -1,37 +1,62 @@
 from gui_resources.infographic_logging.data_object import Data
+from gui_resources.infographic_logging.metric_engine import MetricEngine, metric
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import matplotlib.dates as dates
-from datetime import timedelta
 from matplotlib import cm
 from matplotlib import patches
 import matplotlib.image as img
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from datetime import datetime
 from scipy import signal
 from matplotlib import cycler
 import json
+import functools
+
+# Infographic plot format
+STYLE = {
+    'figure.facecolor': '#474747',
+    'grid.color': '#e3e3e3',
+    'grid.linestyle': 'solid',
+    'xtick.direction': 'in',
+    'xtick.color': '#e3e3e3',
+    'ytick.direction': 'in',
+    'ytick.color': '#e3e3e3',
+    'patch.edgecolor': '#e3e3e3',
+    'lines.linewidth': 1.5,
+    'axes.facecolor': '#474747',
+    'axes.edgecolor': '#474747',
+    'axes.axisbelow': True,  # "axisbelow" set axis ticks and gridlines are below all artists
+    'axes.grid': True,
+    'axes.prop_cycle': cycler('color', ['#fc280f', '#5fdcff', '#f4ba26', '#85c54c', '#c6d7e0']),
+}
+
+# Applies the plt format, only the first infographic of a process has to
+@functools.lru_cache(maxsize=None)
+def apply_style():
+
+    plt.rcParams.update(STYLE)
+
+# Reads the logo once, later infographics reuse the decoded image
+@functools.lru_cache(maxsize=None)
+def load_logo(path='logo.png'):
+
+    return img.imread(path)
 
 # Infographic Object
 class Infographic():
 
     # Initializes with two inputs, the project number and the data frame (data frame is optional)
-    def __init__(self, pnumber: int, data: pd.DataFrame=None):
+    # A MetricEngine can be passed in to share computed metrics between infographics of the same data
+    # An InfographicRenderer can be passed in to draw into its reusable figure instead of a new pyplot figure
+    def __init__(self, pnumber: int, data: pd.DataFrame=None, engine: MetricEngine=None,
+                 renderer: 'InfographicRenderer'=None):
 
         # Initialize the plt format
-        col = cycler('color',
-                        ['#fc280f', '#5fdcff', '#f4ba26', '#85c54c', '#c6d7e0'])
-        plt.rc('figure', facecolor='#474747')
-        plt.rc('grid', color='#e3e3e3', linestyle='solid')
-        plt.rc('xtick', direction='in', color='#e3e3e3')
-        plt.rc('ytick', direction='in', color='#e3e3e3')
-        plt.rc('patch', edgecolor='#e3e3e3')
-        plt.rc('lines', linewidth=1.5)
-        plt.rc('figure', facecolor='#474747')
-        plt.rc('axes', facecolor='#474747', edgecolor='#474747',
-               axisbelow=True, grid=True,
-               prop_cycle=col)  # "axisbelow" set axis ticks and gridlines are below all artists
+        apply_style()
 
         # Allows already loaded data to be passed in as an argument 
         if data is None:
@@ -41,13 +66,29 @@ class Infographic():
                 data['TimeString'] = pd.to_datetime(data['TimeString'], unit='s')
             self.df = data
 
+        # Index the samples of every tag once so metrics do not scan the whole log
+        self.tags = tag_index(self.df)
+
+        # Metrics are cached per data set and time window, the content hash tells apart frames of the same
+        # window whose values differ, i.e. before and after a download that fills in samples
+        self.engine = MetricEngine() if engine is None else engine
+        times = self.df['TimeString']
+        content = int(pd.util.hash_pandas_object(self.df, index=False).sum())
+        self.data_key = (pnumber, len(self.df), times.min(), times.max(), content) if len(self.df) else (pnumber, 0)
+
         # Pull the correct json file
         self.dic = load_project_json(pnumber)
         self.name = self.dic['project_name']
 
         # Create the figure and layout
-        self.fig = plt.figure(figsize=(12, 15), dpi=50, constrained_layout=True)
-        self.gs = self.fig.add_gridspec(nrows=9, ncols=3)
+        self.renderer = renderer
+        if renderer is None:
+            self.fig = plt.figure(figsize=(12, 15), dpi=50, constrained_layout=True)
+            self.gs = self.fig.add_gridspec(nrows=9, ncols=3)
+        else:
+            self.fig = renderer.fig
+            self.gs = renderer.gs
+            renderer.begin()
 
         # Adds long term axis, header, and title
         self.longterm_axis()
@@ -58,10 +99,12 @@ class Infographic():
         # Header function. Adds quantum logo to top of page
     def header(self):
 
-        ax = self.fig.add_subplot(self.gs[0,0:3],frameon = False)
+        ax = self.subplot('header', (0, 1), (0, 3), frameon=False, static=True)
+        if ax is None:
+            return
 
         # Read in logo, throw it in a box, put that box on the axis
-        logo = img.imread('logo.png')
+        logo = load_logo()
         imagebox = OffsetImage(logo, zoom = 0.1,)
         ab = AnnotationBbox(imagebox, (0.5,0.5), pad = 0, frameon = False, annotation_clip = True)
         ax.add_artist(ab)
@@ -73,7 +116,9 @@ class Infographic():
         # Title function. Adds title below quantum logo
     def title(self):
 
-        ax = self.fig.add_subplot(self.gs[1,0:3],frameon = False)
+        ax = self.subplot('title', (1, 2), (0, 3), frameon=False, static=True)
+        if ax is None:
+            return
 
         # Creates date string
         today = datetime.today()
@@ -93,15 +138,17 @@ class Infographic():
     # Long term axis function. Adds long term axis to title section
     def longterm_axis(self):
 
-        ax = self.fig.add_subplot(self.gs[1,0:3],frameon = False)
+        ax = self.subplot('longterm', (1, 2), (0, 3), frameon=False)
 
         # Pull data for axis
         key = self.dic['Medium Pressure Storage'][0]
-        x = self.df.loc[self.df['VarName'] == key].TimeString
-        y = self.df.loc[self.df['VarName'] == key].VarValue*0
+        x, _ = self.series(key)
 
         # Create empty bar graph with x-axis formatting for long-term axis
-        ax.bar(x,y,label='_1',width = 0.01, align = 'edge', zorder = 1)
+        # The bars have no height so only the first and last sample are needed to span the axis
+        if len(x):
+            x = np.array([x.min(), x.max()])
+        ax.bar(x,x.astype(np.float64)*0,label='_1',width = 0.01, align = 'edge', zorder = 1)
         ax.tick_params(axis="x", direction="out", which='major', width=2, length=10)
         ax.xaxis.set_major_locator(dates.DayLocator(interval=1))  # Show major tick every day
         ax.xaxis.set_major_formatter(dates.DateFormatter("%m/%d"))  # Tick label formatting
@@ -111,9 +158,10 @@ class Infographic():
         ax.get_yaxis().set_visible(False)
 
     # Adds a long-term plot, defined by the feature argument.
-    def add_plot(self, feature):
+    # The samples are reduced to one per pixel of the plot, full_resolution draws every sample instead
+    def add_plot(self, feature, full_resolution=False):
 
-        ax = self.fig.add_subplot(self.gs[self.index[0],0:3],frameon= False)
+        ax = self.subplot('plot', (self.index[0], self.index[0]+1), (0, 3), frameon=False)
 
         # Increments the index so plots don't overlap
         self.index= (self.index[0]+1,self.index[1])
@@ -125,21 +173,23 @@ class Infographic():
         x = 0
         y = 0
         if type(tag) != list:  # Single sensor case
-            x = self.df.loc[self.df['VarName'] == tag].TimeString
-            y = self.df.loc[self.df['VarName'] == tag].VarValue
-
-        if type(tag) == list:  # Multiple sensor case. Adds the data from each sensor
-            x = self.df.loc[self.df['VarName'] == tag[0]].TimeString
-            y = ''
-            for i,data in enumerate(tag):
-                if i == 0:
-                    y = self.df.loc[self.df['VarName'] == data].VarValue.reset_index(drop =True)
-                else:
-                    y0 = self.df.loc[self.df['VarName'] == data].VarValue.reset_index(drop =True)
-                    y = y + y0
+            x, y = self.series(tag)
+
+        if type(tag) == list:  # Multiple sensor case. Adds the data from each sensor sample by sample
+            x, y = self.series(tag[0])
+            for data in tag[1:]:
+                _, y0 = self.series(data)
+                n = min(len(y), len(y0))
+                x, y = x[:n], y[:n] + y0[:n]
+
+        # Reduce the data to what the plot can show
+        if not full_resolution:
+            width = self.fig.get_figwidth() * self.fig.dpi
+            height = self.fig.get_figheight() * self.fig.dpi / self.gs.nrows
+            x, y = decimate(x, y, int(width), int(height))
 
         # Plot data with color gradient
-        color = cm.RdYlBu_r(y / max(y))
+        color = cm.RdYlBu_r(y / np.nanmax(y))
         plot = ax.scatter(x, y, color=color)
         sz = np.ones(x.size)
         plot.set_sizes(sz)
@@ -156,7 +206,8 @@ class Infographic():
     # Adds a bubble with the feature requested. Bubbles are used to return a single value
     def add_bubble(self,feature):
 
-        ax = self.fig.add_subplot(self.gs[self.index[0]:(self.index[0]+2), self.index[1]],frameon= True)
+        ax = self.subplot('bubble', (self.index[0], self.index[0]+2), (self.index[1], self.index[1]+1), frameon=True,
+                          keep_format=True)
 
         # Updates to the correct index for future bubbles/plots
         if self.index[1]==2:
@@ -244,82 +295,123 @@ class Infographic():
 
         plt.show()
 
+    # Adds an axis spanning rows [start, stop) and cols [start, stop) of the layout
+    # With a renderer the axis is reused from the previous report, static axes are only drawn once
+    # and None is returned for them when they are already drawn
+    def subplot(self, name, rows, cols, frameon, static=False, keep_format=False):
+
+        if self.renderer is None:
+            return self.fig.add_subplot(self.gs[rows[0]:rows[1], cols[0]:cols[1]], frameon=frameon)
+        return self.renderer.subplot(name, rows, cols, frameon, static, keep_format)
+
+    # Writes the figure to a file or file-like buffer without opening a window
+    # The format is taken from the file extension (png, pdf, ...) unless given
+    def save(self, path, format=None, dpi=None):
+
+        if self.renderer is None:
+            self.fig.savefig(path, format=format, dpi=dpi)
+        else:
+            self.renderer.save(path, format=format, dpi=dpi)
+
+    # Releases the figure once it is no longer needed, a renderer keeps its figure for the next report
+    def close(self):
+
+        if self.renderer is None:
+            plt.close(self.fig)
+
+    # Builds a complete report and writes it to path
+    # plots are features of the project json, bubbles default to every bubble in bubbles.json
+    # The page has room for one plot row above three rows of bubbles
+    @classmethod
+    def render(cls, pnumber, data, path, plots=(), bubbles=None, format=None, engine=None, renderer=None,
+               full_resolution=False):
+
+        infographic = cls(pnumber, data=data, engine=engine, renderer=renderer)
+        try:
+            if bubbles is None:
+                bubbles = load_bubbles_json()
+            for plot in plots:
+                infographic.add_plot(plot, full_resolution)
+            for bubble in bubbles:
+                infographic.add_bubble(bubble)
+            infographic.save(path, format=format)
+        finally:
+            infographic.close()
+
     # Returns average of purity values for requested feature
+    @metric()
     def purity(self, feature):
 
         key = self.dic[feature]
-        data = self.df.loc[self.df['VarName'] == key[0]].VarValue
-        purity = np.mean(data)
+        _, data = self.series(key[0])
+        purity = np.nanmean(data)
         return purity
 
     # Returns the average cold head temp
+    @metric()
     def ch_temp(self, feature):
 
         key = self.dic[feature]
         tags = key[0]
         full = 0
         for tag in tags:
-            full += np.mean(self.df.loc[self.df['VarName'] == tag].VarValue)
+            full += np.nanmean(self.series(tag)[1])
         return full/len(tags)
 
     # Returns the average liquefaction rate
-    def liq_rate(self):
+    @metric('liq_runtime')
+    def liq_rate(self, runtime):
 
         key = self.dic['Liquefier Inlet Flow']
         tags = key[0]
 
-        # Integrates inlet flow to get total flow into liquefier
+        # Integrates inlet flow over the sample times to get total flow into liquefier
         value = 0
         for tag in tags:
-            value += integrate(self.df.loc[self.df['VarName'] == tag].VarValue, 1/2)
+            value += integrate(*self.series(tag))
 
         # Converts to liquid with expansion ratio
         liquid = value/745
 
-        run_hrs, hrs = self.liq_runtime()
+        run_hrs, hrs = runtime
         return liquid / run_hrs * 24
 
     # Returns number of hours liquefier is on, and number of total hours
+    @metric()
     def liq_runtime(self):
 
         key = self.dic['Liquefier State']
-        states = self.df.loc[self.df['VarName'] == key[0]].VarValue.reset_index(drop=True)
-        dt = self.dt('Liquefier State')
-
-        # Iterates through dataframe to find total time, as well as total time liquefier is on (State 4)
-        hrs = 0
-        run_hrs = 0
-        for state in states:
-            hrs += dt
-            if state == 4:
-                run_hrs += dt
-
-        run_hrs = round(run_hrs/60)
-        hrs = round(hrs/60)
+        times, states = self.series(key[0])
+        durations = sample_durations(times)
+
+        # Total time, as well as total time liquefier is on (State 4)
+        hrs = np.sum(durations)
+        run_hrs = np.sum(durations[states == 4])
+
+        run_hrs = round(float(run_hrs)/60)
+        hrs = round(float(hrs)/60)
         return run_hrs, hrs
 
     # Returns the average number of gas bag cycles per day
-    def gb_cycles(self):
+    @metric('liq_runtime')
+    def gb_cycles(self, runtime):
 
         key = self.dic['Gas Bag Storage Level']
-        heights = self.df.loc[self.df['VarName'] == key[0]].VarValue.reset_index(drop = True)
+        _, heights = self.series(key[0])
 
         # Records the number of times the gas bag passes a midpoint to get number of cycles
-        top = max(heights)
-        bottom = min(heights)
+        top = np.max(heights)
+        bottom = np.min(heights)
         mid = round((top-bottom)/2+bottom)
-        value = 0
-        for i in range(0,heights.size-1):
-            x = round(heights[i])
-            y = round(heights[i+1])
-            if x == mid and y != x:
-                value += 1
+        rounded = np.round(heights)
+        value = np.count_nonzero((rounded[:-1] == mid) & (rounded[1:] != rounded[:-1]))
 
-        run_hrs, hrs = self.liq_runtime()
+        run_hrs, hrs = runtime
         return int(round(value/hrs)*24)
 
     # Returns average recovery rate
-    def recovery_rate(self):
+    @metric('liq_runtime', 'leak_rate')
+    def recovery_rate(self, runtime, leak_rate):
 
         key = self.dic['Liquefier Inlet Flow']
         tags = key[0]
@@ -328,15 +420,15 @@ class Infographic():
         # Get total volume leaving storage for liquefier
         out_flow = 0
         for tag in tags:
-            out_flow += integrate(self.df.loc[self.df['VarName'] == tag].VarValue, self.dt("Liquefier Inlet Flow"))
+            out_flow += integrate(*self.series(tag))
 
         # Get estimate of volume leaked
-        run_hrs, hrs = self.liq_runtime()
-        leak = self.leak_rate()*hrs*60
+        run_hrs, hrs = runtime
+        leak = leak_rate*hrs*60
 
         # Get total change in pressure over time period
         pressure_key = self.dic[storage_key][0]
-        pressure = self.df.loc[self.df['VarName'] == pressure_key].VarValue.reset_index(drop = True)
+        _, pressure = self.series(pressure_key)
         volume = (pressure[pressure.size - 1] - pressure[0])*self.dic[storage_key][2]  # Adjusts for volume of storage
 
         # Adjusts for pressure units
@@ -350,86 +442,53 @@ class Infographic():
         return round(rate, 1)
 
     # Return estimated leak rate. Does not account for leak back into PSA
-    def leak_rate(self):
+    @metric('psa_swing')
+    def leak_rate(self, psa):
 
         # Pull down liquefier states
         liq_key = "Liquefier State"
         tag1 = self.dic[liq_key][0]
-        liq_dates= (self.df.loc[self.df['VarName'] == tag1].TimeString).reset_index(drop = True)
-        raw_states = (self.df.loc[self.df['VarName'] == tag1].VarValue).reset_index(drop = True)
+        liq_dates, raw_states = self.series(tag1)
 
         # Pull down storage values
         storage_key = "Medium Pressure Storage"
         tag2 = self.dic[storage_key][0]
-        raw_pressure = (self.df.loc[self.df['VarName'] == tag2].VarValue).reset_index(drop = True)
-        pres_dates = (self.df.loc[self.df['VarName'] == tag2].TimeString).reset_index(drop = True)
+        pres_dates, raw_pressure = self.series(tag2)
 
-        # Return series of bools, true where liquefier state timestamp is also a storage timestamp
+        # Pair each liquefier state with the storage pressure logged at the same time
         # Data has to be pruned to account for different sampling rates
-        # New states list is pruned to only include what is also in storage
-        bools1 = liq_dates.isin(pres_dates)
-        states=[]
-        for i, boo in enumerate(bools1):
-            if boo:
-                states.append(raw_states[i])
-
-        # Do the same thing as above, but true when storage timestamp is also in the revised liquefier timestamp
-        # New pressure list is pruned to be the same lenght at states list
-        bools2 = pres_dates.isin(liq_dates)
-        pressures = []
-        for i, boo in enumerate(bools2):
-            if boo:
-                pressures.append(raw_pressure[i])
-
-        # Find pressures when liquefier is off
-        off_pressure = []
-        tmp = []
-        stor = 2
-        for i, state in enumerate(states):
-            if (state == 2 and stor != 2 and len(tmp) != 0):
-                off_pressure.append(tmp)
-                tmp = []
-                tmp.append(pressures[i])
-            if (state == 2):
-                tmp.append(pressures[i])
-            stor = state
-
-        # Find length of psa swing
-        psa = self.psa_swing()
+        states, pressures = join_on_time(liq_dates, raw_states, pres_dates, raw_pressure)
+
+        # Find runs of pressures when liquefier is off (State 2)
+        # A run is only stored once the next one starts, so the last run is left out
+        edges = np.diff((states == 2).astype(np.int8), prepend=0, append=0)
+        run_starts = np.flatnonzero(edges == 1)
+        run_stops = np.flatnonzero(edges == -1)
+        off_pressure = [pressures[start:stop] for start, stop in zip(run_starts[:-1], run_stops[:-1])]
 
         # Find indices of peaks and valleys
         peak = []
         valley = []
-        for i,list in enumerate(off_pressure):
-            pdata, _ = signal.find_peaks(list, height=0, distance=15*psa)
+        for run in off_pressure:
+            pdata, _ = signal.find_peaks(run, height=0, distance=15*psa)
             peak.append(pdata)
-            flip = [num * -1 for num in list]
-            pos = [num + max(list) for num in flip]
-            vdata, _ = signal.find_peaks(pos, height=0, distance=15*psa)
+            vdata, _ = signal.find_peaks(np.max(run) - run, height=0, distance=15*psa)
             valley.append(vdata)
 
         # Find slope between peak and valley after pressure settles
         slopes = []
         for i in range(0, len(peak)):
             if len(valley[i])<2:
-                pass
-            elif (valley[i])[0]<(peak[i])[0]:
+                continue
+            index = np.arange(len(valley[i]))
+            if (valley[i])[0]<(peak[i])[0]:
                 rg = int((valley[i][1]-peak[i][0])/2)
-                for index, j in enumerate(valley[i]):
-                    if j!= 0:
-                        stop = index
-                        start = index-rg
-                        y = off_pressure[i][start:stop]
-                        m, b = trendline(y)
-                        slopes.append(m)
+                index = index[valley[i] != 0]
             elif (valley[i])[0]>(peak[i])[0]:
                 rg = int((valley[i][0]-peak[i][0])/2)
-                for index, j in enumerate(valley[i]):
-                    stop = index
-                    start = index-rg
-                    y = off_pressure[i][start:stop]
-                    m, b = trendline(y)
-                    slopes.append(m)
+            else:
+                continue
+            slopes.extend(window_slopes(off_pressure[i], index-rg, index))
 
         # Find average slope and convert units to return
         xunit = self.dt(storage_key)
@@ -439,22 +498,28 @@ class Infographic():
             final = round((slope/101.325),2)
             return abs(final)
 
+    # Returns the (times, values) arrays of a tag in log order, empty if the tag is not logged
+    def series(self, tag):
+
+        return self.tags.get(tag, (np.array([], dtype='datetime64[ns]'), np.array([])))
+
     # Return the time interval between samples
+    @metric()
     def dt(self, feature):
 
         key = self.dic[feature][0]
         if type(key) == list:
-            times = (self.df.loc[self.df['VarName'] == key[0]].TimeString).reset_index(drop=True)
-            return (times[1] - times[0]) / timedelta(minutes=1)
+            times, _ = self.series(key[0])
         else:
-            times = (self.df.loc[self.df['VarName'] == key].TimeString).reset_index(drop=True)
-            return (times[1] - times[0]) / timedelta(minutes=1)
+            times, _ = self.series(key)
+        return float((times[1] - times[0]) / np.timedelta64(1, 'm'))
 
     # Return the average length of a PSA swing
+    @metric()
     def psa_swing(self):
 
         tag = self.dic['Medium Pressure Storage']
-        y = (self.df.loc[self.df['VarName'] == tag[0]].VarValue).reset_index(drop=True)
+        _, y = self.series(tag[0])
         raw_peaks, _ = signal.find_peaks(y, height = 0, distance = 2)
         stor = 0
         dt = self.dt('Medium Pressure Storage')
@@ -471,16 +536,198 @@ class Infographic():
         return int(round(swing))
 
 
+# Reusable figure for rendering many infographics without a GUI
+# The figure is drawn with the Agg canvas directly so no pyplot window or backend is involved
+# Axes are kept between reports and cleared instead of recreated, the header and title
+# are drawn once and reused as is
+# With freeze_layout the constrained layout is only computed for the first report of a set of axes,
+# later reports keep those positions even if their tick labels would need other margins
+class InfographicRenderer():
 
+    def __init__(self, dpi=50, freeze_layout=False):
 
+        apply_style()
+        self.fig = Figure(figsize=(12, 15), dpi=dpi, constrained_layout=True)
+        FigureCanvasAgg(self.fig)
+        self.gs = self.fig.add_gridspec(nrows=9, ncols=3)
 
-# Basic discrete integration function
-def integrate(vec, dt):
+        # (name, rows, cols) -> axis, the axes used by the report being drawn and
+        # the axes the layout was last computed for
+        self.axes = {}
+        self.used = set()
+        self.layout = None
+        self.freeze_layout = freeze_layout
+
+    # Starts a new report
+    def begin(self):
+
+        self.used = set()
+
+    # Returns the axis for a slot of the layout, creating it the first time it is used
+    # A static axis keeps its content and None is returned once it has been drawn
+    # An axis with keep_format only has its artists removed instead of being reset, which is
+    # much cheaper for axes whose formatting is the same every time (bubbles)
+    def subplot(self, name, rows, cols, frameon, static=False, keep_format=False):
+
+        key = (name, rows, cols)
+        self.used.add(key)
+        ax = self.axes.get(key)
+        if ax is None:
+            ax = self.fig.add_subplot(self.gs[rows[0]:rows[1], cols[0]:cols[1]], frameon=frameon)
+            self.axes[key] = ax
+            return ax
+        if static:
+            return None
+        if keep_format:
+            for artist in ax.texts + ax.patches + ax.artists + ax.lines + ax.collections:
+                artist.remove()
+            return ax
+
+        # Reset the axis to the state of a new one
+        ax.cla()
+        ax.set_frame_on(frameon)
+        ax.get_xaxis().set_visible(True)
+        ax.get_yaxis().set_visible(True)
+        return ax
+
+    # Writes the current report to a file or file-like buffer
+    # Axes of an earlier report that are not used by this one are hidden and left out of the layout
+    # A frozen layout is only computed again when the report uses other axes than the last one
+    def save(self, path, format=None, dpi=None):
+
+        for key, ax in self.axes.items():
+            ax.set_visible(key in self.used)
+            ax.set_in_layout(key in self.used)
+
+        if not self.freeze_layout:
+            self.fig.savefig(path, format=format, dpi=dpi)
+        elif self.used != self.layout:
+            self.set_constrained_layout(True)
+            self.layout = set(self.used)
+            self.fig.savefig(path, format=format, dpi=dpi)
+            self.set_constrained_layout(False)
+        else:
+            self.fig.savefig(path, format=format, dpi=dpi)
 
-    value = 0
-    for element in vec:
-        value += dt * element
-    return value
+    # Turns the constrained layout on or off, the axes keep their positions when it is turned off
+    def set_constrained_layout(self, constrained):
+
+        if hasattr(self.fig, 'set_layout_engine'):
+            self.fig.set_layout_engine('constrained' if constrained else 'none')
+        else:
+            self.fig.set_constrained_layout(constrained)
+
+    # Releases the figure
+    def close(self):
+
+        self.fig.clear()
+        self.axes = {}
+        self.used = set()
+        self.layout = None
+
+
+
+
+# Builds a tag -> (times, values) index of a Siemens log
+# Samples keep their order in the log, the same as selecting each tag with a boolean mask
+def tag_index(df):
+
+    codes, tags = pd.factorize(df['VarName'])
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(tags)))))
+    order = order[len(order) - bounds[-1]:]  # Missing tag names sort first and are dropped
+    times = df['TimeString'].to_numpy()[order]
+    values = df['VarValue'].to_numpy()[order]
+    return {tag: (times[bounds[i]:bounds[i+1]], values[bounds[i]:bounds[i+1]]) for i, tag in enumerate(tags)}
+
+# Returns the samples of a scatter plot to draw at a size in pixels
+# One sample is kept of every pixel the samples fall on, so noisy data still fills the same band,
+# and the minimum and maximum sample are always kept so the color scale does not change
+def decimate(x, y, width, height):
+
+    if len(x) <= width:
+        return x, y
+
+    # Pixel row and column of every sample
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) == 0:
+        return x[:0], y[:0]
+    t = np.asarray(x[valid]).astype(np.float64)
+    v = y[valid]
+    column = ((t - t.min()) * (width - 1) / max(np.ptp(t), 1e-12)).astype(np.int64)
+    row = ((v - v.min()) * (height - 1) / max(np.ptp(v), 1e-12)).astype(np.int64)
+
+    # First sample of each pixel, in time order
+    _, first = np.unique(column * height + row, return_index=True)
+    keep = np.union1d(valid[first], valid[[np.argmin(v), np.argmax(v)]])
+    return x[keep], y[keep]
+
+# Returns the time in minutes each sample represents, the interval until the next sample
+# The last sample lasts as long as the interval before it
+# Intervals over 10 times the typical sample period are logging gaps and count as one period
+def sample_durations(times):
+
+    if len(times) < 2:
+        return np.zeros(len(times))
+    durations = np.diff(times) / np.timedelta64(1, 'm')
+    durations = np.append(durations, durations[-1])
+    period = np.median(durations)
+    return np.where(durations > 10*period, period, durations)
+
+# Integrates values over their sample times in minutes, each value lasting its sample duration
+# Logging gaps count as one sample period like in sample_durations, not as flow for the whole outage
+def integrate(times, values):
+
+    return float(np.sum(values * sample_durations(times)))
+
+# Pairs the values of two series logged at the same times with a sorted merge join
+# Returns the values of both series at the times they have in common, in the order of the first series
+def join_on_time(times1, values1, times2, values2):
+
+    # Integer nanoseconds search faster than datetimes
+    times1 = times1.astype('datetime64[ns]').view(np.int64)
+    times2 = times2.astype('datetime64[ns]').view(np.int64)
+    if len(times2) == 0:
+        return values1[:0], values2[:0]
+
+    # Series logged at the same instants are already paired
+    if len(times1) == len(times2) and np.array_equal(times1, times2):
+        return values1, values2
+
+    # Logs are normally in time order already
+    if not np.all(times2[1:] >= times2[:-1]):
+        order = np.argsort(times2, kind='stable')
+        times2, values2 = times2[order], values2[order]
+
+    position = np.minimum(np.searchsorted(times2, times1), len(times2) - 1)
+    match = times2[position] == times1
+    return values1[match], values2[position[match]]
+
+# Least squares slopes of y[start:stop] for many windows at once, equal to trendline() on each slice
+# Windows follow python slice rules, windows with fewer than two samples have a slope of 0
+def window_slopes(y, start, stop):
+
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    start = np.clip(np.where(start < 0, start + n, start), 0, n)
+    stop = np.clip(np.where(stop < 0, stop + n, stop), 0, n)
+    length = np.maximum(stop - start, 0).astype(np.float64)
+
+    # Prefix sums of y and k*y so the sums of every window are two lookups
+    k = np.arange(n, dtype=np.float64)
+    sum_y = np.concatenate(([0], np.cumsum(y)))
+    sum_ky = np.concatenate(([0], np.cumsum(k*y)))
+    sy = sum_y[stop] - sum_y[start]
+    sxy = sum_ky[stop] - sum_ky[start] - start*sy
+    sx = length*(length - 1)/2
+    sxx = (length - 1)*length*(2*length - 1)/6
+
+    denom = length*sxx - sx*sx
+    valid = length >= 2
+    slopes = np.zeros(len(length))
+    slopes[valid] = (length[valid]*sxy[valid] - sx[valid]*sy[valid])/denom[valid]
+    return slopes
 
 # Numpy trendline function
 def trendline(y):
@@ -512,3 +759,8 @@ def load_project_json(proj_number: int) -> dict:
 
 
 
+
+# Loads the list of available bubbles
+def load_bubbles_json() -> list:
+    with open('Infographic Settings\\bubbles.json', 'r') as json_file:
+        return json.load(json_file)
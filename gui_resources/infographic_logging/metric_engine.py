@@ -0,0 +1,60 @@
+import functools
+
+# Cache of computed metric results
+# Each result is stored under (data set, time window, metric, arguments) so a metric is computed
+# at most once for the data an infographic is built from, however many bubbles use it
+class MetricEngine():
+
+    def __init__(self):
+
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the cached result for a key, computing and storing it on the first request
+    def get(self, key, compute):
+
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+
+        self.misses += 1
+        value = compute()
+        self.cache[key] = value
+        return value
+
+    # Returns the cache hit and miss counts
+    def stats(self):
+
+        return {'hits': self.hits, 'misses': self.misses, 'cached': len(self.cache)}
+
+    # Removes all cached results
+    def clear(self):
+
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+
+# Decorator for Infographic metrics
+# depends names the metrics whose results are passed to the function after its own arguments,
+# they are looked up through the engine as well so shared intermediates are only computed once
+# The instance must have an engine attribute and a data_key attribute naming its data set and time window
+def metric(*depends):
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(self, *args):
+            key = (self.data_key, function.__name__) + args
+
+            def compute():
+                inputs = [getattr(self, dependency)() for dependency in depends]
+                return function(self, *args, *inputs)
+
+            return self.engine.get(key, compute)
+
+        wrapper.depends = depends
+        return wrapper
+
+    return decorator
@@ -13,6 +13,7 @@ from gui_resources.infographic_logging.infographic import Infographic
 from gui_resources.date_time_input_widget import DateTimeInput
 from gui_resources.error_message import ErrorMessage
 from gui_resources.resource_path import resource_path
+from gui_resources.column_store import ColumnStore
 
 
 
@@ -102,12 +103,13 @@ class InfographicOptions(QWidget):
         Populates a list of plot types based on the Infographic Settings json file
         '''
         # Update the time window to the current min/max of loaded data
-        self.StartDateTime.setDateTime(
-            QDateTime.fromTime_t(int(self.MainWindow.loadedData.iloc[0]['TimeString']))
-        )
-        self.EndDateTime.setDateTime(
-            QDateTime.fromTime_t(int(self.MainWindow.loadedData.iloc[-1]['TimeString']))
-        )
+        if isinstance(self.MainWindow.loadedData, ColumnStore):
+            start, end = self.MainWindow.loadedData.timeRange()
+        else:
+            start = self.MainWindow.loadedData.iloc[0]['TimeString']
+            end = self.MainWindow.loadedData.iloc[-1]['TimeString']
+        self.StartDateTime.setDateTime(QDateTime.fromTime_t(int(start)))
+        self.EndDateTime.setDateTime(QDateTime.fromTime_t(int(end)))
 
         # Load list of plot types
         path = f'Infographic Settings\\{project_number}.json'
@@ -135,6 +137,10 @@ class InfographicOptions(QWidget):
             ErrorMessage('Invalid date/time range. Check your start and end date/time.')
             return None
         
+        # Streamed data only reads the requested window from disk
+        if isinstance(self.MainWindow.loadedData, ColumnStore):
+            return self.MainWindow.loadedData.toFrame(start, end)
+
         data = self.MainWindow.loadedData.copy()
 
         data = data[data.TimeString > start]
@@ -0,0 +1,111 @@
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+from gui_resources.data_loading import read_csv_log, read_pickle_log, read_parquet_log, \
+                                        split_data_sets, stream_csv_to_store, LoadCancelled
+from gui_resources.data_cache import DataCache
+from gui_resources.column_store import ColumnStore
+
+
+
+class LoadWorkerSignals(QObject):
+    '''
+    Signals emitted by a LoadWorker
+    QRunnable is not a QObject so the signals live on a separate object
+    '''
+    # Bytes read, total bytes, rows parsed, 64 bit so files over 2 GiB are reported correctly
+    progress = pyqtSignal('qint64', 'qint64', 'qint64')
+    # (data frame or ColumnStore, list of (name, data) pairs)
+    finished = pyqtSignal(object)
+    # Error message
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+
+class LoadWorker(QRunnable):
+    '''
+    Loads and splits a data log on a QThreadPool thread so the GUI stays responsive
+    path: str = Path to the csv, txt, pickle or Parquet file, or a Parquet project log folder
+    settings: dict = csv import settings
+    cache: DataCache = Cache of previously parsed csv files
+    streaming: bool = Stream the csv into an on-disk ColumnStore instead of loading it into memory
+    '''
+    def __init__(self, path: str, settings: dict, cache: DataCache, streaming: bool=False) -> None:
+        super().__init__()
+        self.path = path
+        self.streaming = streaming
+        self.settings = dict(settings)
+        self.cache = cache
+        self.signals = LoadWorkerSignals()
+        self.is_cancelled = False
+
+    def cancel(self) -> None:
+        '''
+        Requests the load to stop at the next chunk
+        '''
+        self.is_cancelled = True
+
+    def run(self) -> None:
+        '''
+        Loads the file, runs on a worker thread
+        '''
+        try:
+            filetype = self.path.split('/')[-1].split('.')[-1]
+            if filetype == 'pickle':
+                df = read_pickle_log(self.path, self.settings)
+            elif filetype == 'parquet':
+                df = read_parquet_log(self.path, self.settings)
+            elif self.streaming:
+                df = self.streamToStore()
+            else:
+                # Use the cached copy of the file if it has not changed since it was last parsed
+                df = self.cache.load(self.path, self.settings)
+                if df is None:
+                    df = read_csv_log(
+                        self.path,
+                        self.settings,
+                        progress=self.signals.progress.emit,
+                        cancelled=lambda: self.is_cancelled
+                        )
+                    self.cache.store(self.path, self.settings, df)
+
+            # Split into data sets before handing back so the GUI thread only builds widgets
+            if self.is_cancelled:
+                raise LoadCancelled()
+            if isinstance(df, ColumnStore):
+                datasets = [(name, df.series(name)) for name in df.names()]
+            else:
+                datasets = split_data_sets(df)
+            if self.is_cancelled:
+                raise LoadCancelled()
+
+        except LoadCancelled:
+            self.signals.cancelled.emit()
+            return
+        except Exception as ex:
+            self.signals.failed.emit(str(ex))
+            return
+
+        self.signals.finished.emit((df, datasets))
+
+    def streamToStore(self) -> ColumnStore:
+        '''
+        Streams the csv into a ColumnStore in the cache directory, reusing a finished store
+        if the file and settings have not changed
+        '''
+        store_path = self.cache.storePath(self.path, self.settings)
+        if ColumnStore.isComplete(store_path):
+            self.cache.touch(store_path)
+            return ColumnStore(store_path)
+
+        store = stream_csv_to_store(
+            self.path,
+            self.settings,
+            store_path,
+            memory_limit_mb=self.settings.get('memory_limit_mb', 512),
+            progress=self.signals.progress.emit,
+            cancelled=lambda: self.is_cancelled
+            )
+        if self.cache.enabled():
+            self.cache.evict(keep=store_path)
+        return store
@@ -55,3 +55,6 @@ class MenuComboInputWidget(QWidgetAction):
 
     def addItem(self, text) -> None:
         self.combo_box.addItem(text)
+
+    def currentText(self) -> str:
+        return self.combo_box.currentText()
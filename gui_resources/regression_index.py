@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+
+
+
+class RegressionIndex:
+    '''
+    Block prefix sums of a series used to fit a least squares line to any window in constant time
+    Sums of n, x, y, xy and x^2 are accumulated per block of samples, the fit of a window
+    combines the whole blocks it covers with the samples in the partial blocks at its ends
+    x values are measured from the middle of the series to keep the sums well conditioned
+    NaN samples are ignored
+    x: np.ndarray = Sorted x values (UNIX times)
+    y: np.ndarray = y values
+    block_size: int = Number of samples per block, bounds the work per fit
+    '''
+    def __init__(self, x: np.ndarray, y: np.ndarray, block_size: int=256) -> None:
+        self.x = x
+        self.y = y
+        self.block_size = block_size
+        self.origin = (float(x[0]) + float(x[-1]))/2 if len(x) else 0.0
+
+        # Sums over each whole block, then cumulative sums so any run of blocks is one subtraction
+        blocks = len(x) // block_size
+        sums = self.sums(0, blocks*block_size, axis_blocks=blocks)
+        self.prefix = np.zeros((len(sums), blocks + 1))
+        self.prefix[:, 1:] = np.cumsum(sums, axis=1)
+
+    def sums(self, start: int, end: int, axis_blocks: int=None) -> np.ndarray:
+        '''
+        Returns the sums (n, x, y, xy, x^2) of the samples in [start, end)
+        If axis_blocks is given the samples are summed per block instead
+        '''
+        x = np.asarray(self.x[start:end], dtype=np.float64) - self.origin
+        y = np.asarray(self.y[start:end], dtype=np.float64)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x = np.where(valid, x, 0)
+        y = np.where(valid, y, 0)
+        terms = np.stack((valid.astype(np.float64), x, y, x*y, x*x))
+        if axis_blocks is None:
+            return terms.sum(axis=1)
+        return terms.reshape(len(terms), axis_blocks, -1).sum(axis=2)
+
+    def windowSums(self, lower: int, upper: int) -> np.ndarray:
+        '''
+        Returns the sums (n, x, y, xy, x^2) of the samples in [lower, upper) using the block prefix sums
+        '''
+        b0 = -(-lower // self.block_size)
+        b1 = upper // self.block_size
+        if b1 <= b0:
+            return self.sums(lower, upper)
+        return (self.prefix[:, b1] - self.prefix[:, b0]
+                + self.sums(lower, b0*self.block_size)
+                + self.sums(b1*self.block_size, upper))
+
+    def fit(self, lower: int, upper: int) -> tuple:
+        '''
+        Returns the slope (per x unit) and intercept at the origin of the least squares line
+        through the samples in [lower, upper), or None if the window has fewer than two distinct x values
+        '''
+        n, sx, sy, sxy, sxx = self.windowSums(lower, upper)
+        denom = n*sxx - sx*sx
+        if n < 2 or denom <= 0:
+            return None
+        m = (n*sxy - sx*sy)/denom
+        b = (sy - m*sx)/n
+        return m, b
+
+    def predict(self, x: np.ndarray, fit: tuple) -> np.ndarray:
+        '''
+        Returns the values of a fitted line at x
+        '''
+        m, b = fit
+        return m*(np.asarray(x, dtype=np.float64) - self.origin) + b
+
+
+
+if __name__ == '__main__':
+    # Compare constant time fits against np.polyfit for a 10M point series
+    n = 10_000_000
+    x = 1.67e9 + np.arange(n, dtype=np.float64)*10
+    y = np.random.rand(n) + x*1e-6
+
+    start = time.perf_counter()
+    index = RegressionIndex(x, y)
+    print(f'Build: {time.perf_counter() - start:.3f} s, {index.prefix.nbytes/1e6:.1f} MB')
+
+    for lower, upper in [(0, n), (123, 4_567_891), (5_000_000, 5_000_100)]:
+        start = time.perf_counter()
+        m, b = index.fit(lower, upper)
+        fitted = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = np.polyfit(x[lower:upper] - index.origin, y[lower:upper], 1)
+        polyfit = time.perf_counter() - start
+        print(f'[{lower}, {upper}): fit {fitted*1000:.3f} ms, polyfit {polyfit*1000:.1f} ms, '
+              f'slope error {abs(m - expected[0])/abs(expected[0]):.1e}')
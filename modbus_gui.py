@@ -2,6 +2,7 @@
 Standard Python packages
 '''
 import sys
+import time
 from datetime import datetime
 import os
 import json
@@ -16,23 +17,30 @@ from PyQt5.QtWidgets import QApplication, QMainWindow, QDockWidget, QWidget, \
                             QAction, QFileDialog, QGridLayout, QToolBar, \
                             QCheckBox, QPushButton, QLabel, QMenuBar, QMenu, \
                             QWidgetAction, QLineEdit, QVBoxLayout, QComboBox
-from PyQt5.QtCore import Qt, QPointF, QTimer
+from PyQt5.QtCore import Qt, QPointF, QTimer, pyqtSignal
 from PyQt5.QtGui import QIcon, QCloseEvent
 
 '''
 Data analysis packages
 '''
+import numpy as np
 import pandas as pd
+import pyqtgraph as pg
 
 '''
 Custom packages
 '''
 from gui_resources.graph_widget import GraphWidget
+from gui_resources.decimation import minMaxColumns
 from gui_resources.resource_path import resource_path
 from gui_resources.menu_input import MenuTextInputWidget, MenuComboInputWidget
 from gui_resources.graph_layout_widget import ButtonGrid
 from gui_resources.channel_selection_widget import ChannelSelectionWidget
+from gui_resources.error_message import ErrorMessage
 from modbus_resources.ModbusLogging import ModbusLogger
+from modbus_resources.ring_buffer import RingBuffer
+from modbus_resources.polling_engine import PollingEngine, ModbusDevice
+from modbus_resources.tag_map import TagMap
 
 
 
@@ -40,14 +48,29 @@ class ModbusGui(QMainWindow):
     '''
     The main GUI window used for the Modbus viewer/logger
     '''
+    # Polls made by the engine thread, delivered to the GUI thread (device, UNIX time, tag values)
+    pollReceived = pyqtSignal(object, float, object)
+    pollFailed = pyqtSignal(object, str)
+
     def __init__(self) -> None:
         super().__init__()
 
-        # Modbus class for data/connection management
+        # Modbus class for data management
         self.Logger = ModbusLogger(tag_map=[0 for _ in range(60)])
-        self.pollTimer = QTimer()
-        self.pollTimer.timeout.connect(lambda: print(self.Logger.readAllRegisters()))
-        self.pollTimer.setInterval(1000)
+
+        # Seconds of polls kept in memory while logging to disk
+        self.LoggingRetention = 3600
+
+        # Polls the Modbus servers off the GUI thread so a slow server can not block the window
+        self.Engine = PollingEngine(
+            callback=lambda device, t, values: self.pollReceived.emit(device, t, values),
+            error_callback=lambda device, ex: self.pollFailed.emit(device, repr(ex))
+        )
+        self.pollReceived.connect(self.pollLogged)
+
+        # Device polled for the log, see connectModbus
+        self.Device = None
+        self.pollFailed.connect(lambda device, error: print(f'Error polling {device.name}: ', error))
 
         # Main window settings
         self.setWindowTitle('QuantumView')
@@ -57,6 +80,7 @@ class ModbusGui(QMainWindow):
         #TODO implement across all classes
         self.GraphArraySize = (3, 3)
         self.Graphs = MultiGraphWidget()
+        self.Graphs.setBuffer(self.Logger.buffer)
         self.setCentralWidget(self.Graphs)
 
         # Construct and add the menu to the window
@@ -67,6 +91,7 @@ class ModbusGui(QMainWindow):
 
         # Construct channel selection widget
         self.ChannelSelectionWidget = ChannelSelectionWidget(self)
+        self.ChannelSelectionWidget.setChannels(self.Logger.columnNames())
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.ChannelSelectionWidget)
     
     def constructMenuBar(self) -> None:
@@ -122,12 +147,16 @@ class ModbusGui(QMainWindow):
     def constructSettingsMenu(self) -> None:        
         # Checkbox for enabling logging
         self.enableLogging = QCheckBox(' Enable logging')
+        self.enableLogging.toggled.connect(self.setLogging)
         self.enableLoggingAction = QWidgetAction(self.enableLogging)
         self.enableLoggingAction.setDefaultWidget(self.enableLogging)
         self.SettingsMenu.addAction(self.enableLoggingAction)
 
-        # Path to log file
+        # Path to log file, logging moves to a changed path right away
         self.logPathInput = MenuTextInputWidget('Log Path')
+        self.logPathInput.setText('Logs\\ModbusLog.csv')
+        self.logPathInput.line_edit.editingFinished.connect(
+            lambda: self.setLogging(True) if self.enableLogging.isChecked() else None)
         self.SettingsMenu.addAction(self.logPathInput)
 
     def constructViewMenu(self) -> None:
@@ -151,30 +180,281 @@ class ModbusGui(QMainWindow):
         # self.numGraphs.currentTextChanged.connect(lambda num: self.Graphs.,(int(num)))
     
     def connectModbus(self) -> None:
-        # Connect to logger using the settings
-        self.Logger.connect(
+        # Stop polling the previous connection before its tag map is replaced
+        self.Engine.removeDevice('PLC')
+        self.Device = None
+
+        # Load the selected tag map, the graphs start over with its channels
+        if self.tagMapCombo.currentText():
+            self.Logger.setTagMap(TagMap.load(f"modbus_resources\\Tag Maps\\{self.tagMapCombo.currentText()}.json"))
+            self.Graphs.clearChannels()
+            self.Graphs.setBuffer(self.Logger.buffer)
+            self.ChannelSelectionWidget.setChannels(self.Logger.columnNames())
+
+        # Poll the server using the settings
+        self.Device = ModbusDevice(
+            'PLC',
             ip=self.ipInput.text(),
             port=int(self.portInput.text()),
-            unit_id=int(self.unitIdInput.text())
+            unit_id=int(self.unitIdInput.text()),
+            interval=1.0,
+            tag_map=self.Logger.tag_map
         )
+        self.Engine.addDevice(self.Device)
+        self.Engine.start()
 
-        # Start timer
-        #TODO temporary
-        self.pollTimer.start()
+    def pollLogged(self, device: ModbusDevice, t: float, values: np.ndarray) -> None:
+        '''
+        Slot for polls made by the engine, adds them to the log
+        Polls of a previous connection still queued for the GUI thread are dropped, they belong to another tag map
+        '''
+        if device is not self.Device:
+            return
+        self.Logger.logValues(t, values)
+
+    def setLogging(self, enabled: bool) -> None:
+        '''
+        Starts or stops appending polls to the log path on disk
+        Only the last LoggingRetention seconds are kept in memory while logging
+        '''
+        if not enabled:
+            self.Logger.stopWriter()
+            self.Logger.setRetention(None)
+            return
+
+        path = self.logPathInput.text().strip()
+        try:
+            if not path or os.path.isdir(path):
+                raise ValueError(f'Log path "{path}" is not a file path')
+            self.Logger.startWriter(path)
+            self.Logger.setRetention(self.LoggingRetention)
+        except (ValueError, OSError) as ex:
+            # Show logging as off again without calling back into this slot
+            self.enableLogging.blockSignals(True)
+            self.enableLogging.setChecked(False)
+            self.enableLogging.blockSignals(False)
+            self.Logger.stopWriter()
+            ErrorMessage(f'Could not start logging: {ex}')
+
+    def closeEvent(self, a0: QCloseEvent) -> None:
+        '''
+        Overwrite of close event to stop polling and write the remaining polls to the log
+        '''
+        self.Engine.stop()
+        self.Logger.stopWriter()
+        return super().closeEvent(a0)
       
 
 
+class LiveGraph:
+    '''
+    Channels of the live Modbus log drawn on one graph
+    A graph that follows the data shows the last window seconds and is scaled to the drawn values,
+    panning or zooming stops it following and the auto range button (A) resumes. Graphs that do not
+    follow are redrawn for their view range, see GraphWidget.addRangeListener
+    Following graphs keep the min and max of every pixel column that is complete, so a redraw only
+    decimates the rows polled since and is only needed once the window moved by a pixel column
+    graph: GraphWidget = Graph the channels are drawn on
+    '''
+    def __init__(self, graph: GraphWidget) -> None:
+        self.graph = graph
+
+        # Buffer column -> curve
+        self.curves = {}
+
+        # Set when the graph needs drawing whether or not new polls arrived
+        self.dirty = True
+        self.follow = True
+        graph.getViewBox().sigRangeChangedManually.connect(lambda _: self.setFollow(False))
+        graph.getPlotItem().autoBtn.clicked.connect(lambda _: self.setFollow(True))
+        graph.addRangeListener(self)
+
+        # Time of the newest row drawn
+        self.drawnLast = None
+        self.resetBuckets()
+
+    def resetBuckets(self) -> None:
+        '''
+        Drops the decimated pixel columns, they are rebuilt on the next draw
+        '''
+        # Seconds per pixel column, (x, min/max rows) of the complete columns and the end of the last one
+        self.bucketWidth = None
+        self.bucketX = np.empty(0)
+        self.bucketY = np.empty((0, len(self.curves)))
+        self.bucketsEnd = -np.inf
+        self.dirty = True
+
+    def bind(self, column: int, name: str) -> None:
+        '''
+        Draws a column of the buffer on the graph
+        '''
+        if column in self.curves:
+            return
+        # Plain curves, the points are clipped and decimated for all channels at once in draw()
+        # Tags can decode to NaN, those samples are left out as gaps in the line
+        curve = pg.PlotCurveItem(pen=pg.mkPen(pg.intColor(len(self.curves), hues=9)), name=name,
+                                 connect='finite')
+        self.graph.addItem(curve)
+        self.curves[column] = curve
+        self.graph.showLegend(True)
+        self.resetBuckets()
+
+    def unbind(self, column: int) -> None:
+        '''
+        Removes a column of the buffer from the graph
+        '''
+        curve = self.curves.pop(column, None)
+        if curve is not None:
+            self.graph.removeItem(curve)
+            self.graph.showLegend(bool(self.curves))
+            self.resetBuckets()
+
+    def setFollow(self, follow: bool) -> None:
+        '''
+        Sets whether the graph scrolls with the newest data
+        '''
+        self.follow = follow
+        self.dirty = True
+
+    def isShown(self) -> bool:
+        # Following graphs are drawn for the newest data rather than their view range
+        return self.graph.isVisible() and not self.follow
+
+    def rangeChanged(self, x0: float, x1: float, pixels: int) -> None:
+        self.dirty = True
+
+    def needsDraw(self, last: float, window: float) -> bool:
+        '''
+        Check if the graph shows anything different with the newest row at time last
+        '''
+        if not self.curves or not self.graph.isVisible():
+            return False
+        if self.dirty or self.drawnLast is None or last < self.drawnLast:
+            return True
+        if self.follow:
+            # The window moved by at least one pixel column
+            return last - self.drawnLast >= window / self.graph.viewPixelWidth()
+        # New rows inside the view
+        return last > self.drawnLast and self.drawnLast < self.graph.getViewBox().viewRange()[0][1]
+
+    def draw(self, times: np.ndarray, values: np.ndarray, window: float) -> None:
+        '''
+        Draws the channels from the buffer's times and values
+        '''
+        if self.drawnLast is not None and times[-1] < self.drawnLast:
+            # The buffer was cleared or replaced
+            self.resetBuckets()
+        self.dirty = False
+        self.drawnLast = times[-1]
+        if self.follow:
+            x, y = self.followPoints(times, values, window)
+        else:
+            x, y = self.viewPoints(times, values)
+        for i, curve in enumerate(self.curves.values()):
+            curve.setData(x, y[:, i])
+
+        # Scaling to the drawn points is much cheaper than auto ranging every curve
+        if self.follow:
+            finite = y[np.isfinite(y)]
+            y0, y1 = (finite.min(), finite.max()) if finite.size else (0, 1)
+            pad = 0.05*(y1 - y0) or 0.5
+            self.graph.setRange(xRange=(times[-1] - window, times[-1]), yRange=(y0 - pad, y1 + pad), padding=0)
+            # Apply the range now, pyqtgraph would otherwise apply it while painting and paint twice
+            self.graph.getViewBox().updateMatrix()
+
+    def followPoints(self, times: np.ndarray, values: np.ndarray, window: float) -> tuple:
+        '''
+        Returns the (x, y) points of the last window seconds, the min and max of every complete
+        pixel column followed by the rows of the column being filled
+        '''
+        columns = list(self.curves)
+        last = times[-1]
+        width = window / self.graph.viewPixelWidth()
+        if width != self.bucketWidth:
+            self.resetBuckets()
+            self.bucketWidth = width
+
+        # Columns are aligned to multiples of the width so complete ones never change
+        filling = np.floor(last / width) * width
+        i0 = int(np.searchsorted(times, max(self.bucketsEnd, last - window - width), side='left'))
+        i1 = int(np.searchsorted(times, filling, side='left'))
+        if i1 > i0:
+            ids = np.floor(times[i0:i1] / width)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+            rows = values[i0:i1, columns]
+            # NaN samples are skipped, a pixel column of only NaN stays NaN and is drawn as a gap
+            lows = np.fmin.reduceat(rows, starts, axis=0)
+            highs = np.fmax.reduceat(rows, starts, axis=0)
+            y = np.empty((2*len(starts), len(columns)))
+            y[0::2] = lows
+            y[1::2] = highs
+            self.bucketX = np.concatenate((self.bucketX, np.repeat(ids[starts] * width, 2)))
+            self.bucketY = np.concatenate((self.bucketY, y))
+        self.bucketsEnd = max(self.bucketsEnd, filling)
+
+        # Drop columns that scrolled out of the window
+        keep = int(np.searchsorted(self.bucketX, last - window - width, side='left'))
+        self.bucketX = self.bucketX[keep:]
+        self.bucketY = self.bucketY[keep:]
+
+        i1 = int(np.searchsorted(times, self.bucketsEnd, side='left'))
+        return (np.concatenate((self.bucketX, times[i1:])),
+                np.concatenate((self.bucketY, values[i1:, columns])))
+
+    def viewPoints(self, times: np.ndarray, values: np.ndarray) -> tuple:
+        '''
+        Returns the (x, y) points of the view range, decimated to the graph's width
+        '''
+        x0, x1 = self.graph.getViewBox().viewRange()[0]
+
+        # Rows in the x range plus one either side so lines run off the edge of the view
+        i0 = max(int(np.searchsorted(times, x0, side='left')) - 1, 0)
+        i1 = min(int(np.searchsorted(times, x1, side='right')) + 1, len(times))
+        return minMaxColumns(times[i0:i1], values[i0:i1, list(self.curves)], self.graph.viewPixelWidth())
+
+
+
 class MultiGraphWidget(QWidget):
-    def __init__(self) -> None:
+    '''
+    Grid of graphs streaming channels of the live Modbus log
+    Channels (columns of the logger's ring buffer) are bound to graph cells and drawn straight from
+    the buffer, no data frame is built from the log to draw it. Graphs are only redrawn when they
+    would show something different (see LiveGraph.needsDraw), and each display frame only draws
+    graphs until frame_budget seconds are spent, the rest are drawn in the following frames
+    window: float = Seconds of data shown by graphs that follow the data
+    frame_budget: float = Seconds of drawing per frame, None uses half the frame interval
+    '''
+    def __init__(self, window: float=300.0, frame_budget: float=None) -> None:
         super().__init__()
 
         # Set layout of widget
         self.layout = QGridLayout()
         self.setLayout(self.layout)
 
+        # Live data, see setBuffer
+        self.buffer = None
+        self.window = window
+
+        # (row, col) -> LiveGraph
+        self.live = {}
+
+        # Graphs are checked round robin from nextGraph so a full frame does not starve the last ones
+        self.nextGraph = 0
+        self.framesDrawn = 0
+        self.graphsDrawn = 0
+
         # Iteratively create graphs
         self.initGraphs()
 
+        # Redraw at the refresh rate of the display rather than the poll rate
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None and screen.refreshRate() > 0 else 60
+        self.frame_budget = frame_budget if frame_budget is not None else 0.5 / refresh_rate
+        self.RefreshTimer = QTimer()
+        self.RefreshTimer.setInterval(int(1000 / refresh_rate))
+        self.RefreshTimer.timeout.connect(self.refresh)
+        self.RefreshTimer.start()
+
     def initGraphs(self) -> None:
         '''
         Initializes the graphs in the layout
@@ -184,11 +464,72 @@ class MultiGraphWidget(QWidget):
             self.layout.setRowStretch(row, 1)
             self.layout.setColumnStretch(row, 1)
             for col in range(3):
-                graph = GraphWidget()
+                graph = GraphWidget(local_time=True)
                 graph.hide()
                 self.layout.addWidget(graph, row, col)
+                self.live[(row, col)] = LiveGraph(graph)
         self.showAllGraphs()
 
+    def setBuffer(self, buffer: RingBuffer) -> None:
+        '''
+        Sets the ring buffer the channels are drawn from
+        '''
+        self.buffer = buffer
+        for live in self.live.values():
+            live.resetBuckets()
+
+    def bindChannel(self, row: int, col: int, column: int, name: str=None) -> None:
+        '''
+        Draws a column of the buffer on the graph at (row, col)
+        '''
+        self.live[(row, col)].bind(column, name if name is not None else str(column))
+
+    def unbindChannel(self, row: int, col: int, column: int) -> None:
+        '''
+        Removes a column of the buffer from the graph at (row, col)
+        '''
+        self.live[(row, col)].unbind(column)
+
+    def boundChannels(self, row: int, col: int) -> list:
+        '''
+        Returns the columns of the buffer drawn on the graph at (row, col)
+        '''
+        return list(self.live[(row, col)].curves)
+
+    def clearChannels(self) -> None:
+        '''
+        Removes all channels from all graphs
+        '''
+        for live in self.live.values():
+            for column in list(live.curves):
+                live.unbind(column)
+
+    def refresh(self) -> None:
+        '''
+        Redraws the shown graphs that have something new to show, within the frame budget
+        '''
+        buffer = self.buffer
+        if buffer is None or not len(buffer):
+            return
+        last = buffer.last()[0]
+        # Drawing a graph costs the draw and the paint that follows it, estimated by its last paint
+        spent = 0.0
+        graphs = list(self.live.values())
+        drawn = 0
+        for i in range(len(graphs)):
+            live = graphs[(self.nextGraph + i) % len(graphs)]
+            if not live.needsDraw(last, self.window):
+                continue
+            if drawn and spent + live.graph.paintTime > self.frame_budget:
+                self.nextGraph = (self.nextGraph + i) % len(graphs)
+                break
+            start = time.perf_counter()
+            live.draw(buffer.times(), buffer.values(), self.window)
+            spent += time.perf_counter() - start + live.graph.paintTime
+            drawn += 1
+        self.graphsDrawn += drawn
+        self.framesDrawn += bool(drawn)
+
     def graphAt(self, row: int, col: int) -> GraphWidget:
         '''
         Returns the graph widget at the coordinate
@@ -213,6 +554,8 @@ class MultiGraphWidget(QWidget):
         for i in range(row+1):
             for j in range(col+1):
                 self.graphAt(i, j).show()
+        for live in self.live.values():
+            live.dirty = True
     
     def hideAllGraphs(self) -> None:
         '''
@@ -245,6 +588,8 @@ class MultiGraphWidget(QWidget):
         # Show all widgets
         for i in range(self.layout.count()):
             self.layout.itemAt(i).widget().show()
+        for live in self.live.values():
+            live.dirty = True
 
 
 
@@ -1,20 +1,28 @@
 from pyModbusTCP.client import ModbusClient
+from dateutil import tz
+import numpy as np
 import pandas as pd
 import time
 from datetime import datetime
 import os
 
+from modbus_resources.ring_buffer import RingBuffer
+from modbus_resources.log_writer import LogWriter
+from modbus_resources.tag_map import TagMap
+
 
 
 '''
 Tag Map
 
-- List index corresponds to holding register index
-- Each index has the tag name and scaling that needs to be applied
+- List index corresponds to holding register index unless an address is given
+- Each index has the tag name and scaling that needs to be applied, and optionally the
+  register type (int16, uint16, int32, uint32, float32) and word/byte order, see TagMap
 
 tag_map = [
     {tag: 'Inlet Purity', scaling: 0.01},
-    {tag: 'Outlet Purity', scaling: 0.01}
+    {tag: 'Outlet Purity', scaling: 0.01},
+    {tag: 'Flow', address: 60, type: 'float32', word_order: 'little'}
 ]
 '''
 
@@ -23,28 +31,89 @@ class ModbusLogger:
     '''
     Class for handling connection to Modbus server and caching a log
     log_path: str = Absolute path to CSV log location
-    tag_map: str = Mapping modbus registers to tag names and scaling
+    tag_map: list = Mapping modbus registers to tag names and scaling (list of entries or TagMap)
     log_freq: float = Time between modbus calls
+    retention: float = Seconds of data kept in memory, None keeps everything
     '''
-    def __init__(self, log_path: str=None, tag_map: list=None, log_freq: float=1.0) -> None:
+    def __init__(self, log_path: str=None, tag_map: list=None, log_freq: float=1.0, retention: float=None) -> None:
         # Absolute path to log save location
         self.log_path = log_path
 
-        # Dictionary map of tag locations and scaling
-        self.tag_map = tag_map
-
         # Time between Modbus requests (seconds)
         self.log_freq = log_freq
 
-        # Currently loaded data
-        self.log = pd.DataFrame()
-    
+        # Background writer appending polls to log_path, see startWriter
+        self.writer = None
+
+        # Currently loaded data, one row of register values per poll
+        self.retention = retention
+        self.setTagMap(tag_map)
+
+    @property
+    def log(self) -> pd.DataFrame:
+        '''
+        Currently loaded data as a data frame indexed by read time, built from the buffer when requested
+        '''
+        index = pd.to_datetime(self.buffer.times(), unit='s', utc=True).tz_convert(tz.tzlocal()).tz_localize(None)
+        return pd.DataFrame(self.buffer.values().copy(), index=index, columns=self.columnNames())
+
     def logRegisters(self) -> None:
         # Get the current time 
-        t = datetime.now()
+        t = time.time()
 
         # Append the data to the active log 
-        self.log = pd.concat([self.log, self.readAllRegisters()], axis=0)
+        self.logValues(t, self.readRegisters())
+
+    def logValues(self, t: float, values: np.ndarray) -> None:
+        '''
+        Appends tag values read at UNIX time t to the log, used for polls made by the PollingEngine
+        '''
+        self.buffer.append(t, values)
+        if self.writer is not None:
+            self.writer.put(t, values)
+
+    def startWriter(self, path: str=None, **kwargs) -> LogWriter:
+        '''
+        Starts appending every logged poll to daily CSV files at path (default log_path) in the background
+        kwargs are passed to LogWriter (flush_interval, flush_rows, max_bytes, fsync)
+        Set a retention on the logger for long runs so the history is only kept on disk
+        Raises ValueError if no path is given and OSError if its folder can not be created or written to
+        '''
+        path = path or self.log_path
+        if not path:
+            raise ValueError('No log path set')
+        # Check the folder here, the writer thread could only print the error
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        if not os.access(folder, os.W_OK):
+            raise PermissionError(f'Can not write to {folder}')
+
+        self.stopWriter()
+        self.writer = LogWriter(path, self.columnNames(), **kwargs)
+        self.writer_kwargs = kwargs
+        self.writer.start()
+        return self.writer
+
+    def stopWriter(self) -> None:
+        '''
+        Writes the remaining polls and stops the background writer
+        '''
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+
+    def setRetention(self, retention: float) -> None:
+        '''
+        Sets the seconds of data kept in memory, None keeps everything
+        '''
+        self.retention = retention
+        self.buffer.retention = retention
+
+    def columnNames(self) -> list:
+        '''
+        Returns the tag name of every register, or its index if the tag map has no name for it
+        '''
+        return self.tag_map.names()
 
     def connect(self, ip: str='192.168.0.1', port: int=503, unit_id: int=2) -> ModbusClient:
         # Tries to initialize a connection to a Modbus server 
@@ -54,29 +123,25 @@ class ModbusLogger:
         except:
             raise Exception('Failed to connect')
     
-    def readAllRegisters(self) -> pd.DataFrame:
-        # Read all registers
-        regs = self.client.read_holding_registers(0, len(self.tag_map))
+    def readRegisters(self) -> np.ndarray:
+        # Read the registers of the tag map in as few requests as possible and decode the tag values
+        return self.tag_map.readWith(self.client.read_holding_registers)
 
-        # Check if the read was succesful
-        # If success return a dataframe with the read time as the index
-        if regs is not None:
-            return pd.DataFrame([regs], index=[datetime.now()])
-        else:
-            raise Exception('Failed to read registers')
+    def readAllRegisters(self) -> pd.DataFrame:
+        # Read all registers and return a dataframe with the read time as the index
+        return pd.DataFrame([self.readRegisters()], index=[datetime.now()], columns=self.columnNames())
         
     def toCsv(self, path: str) -> None:
         '''
         Save the currently loaded log to csv
         '''
-        self.log = self.log.rename_axis('time')
-        self.log.to_csv(path)
+        self.log.rename_axis('time').to_csv(path)
 
     def clearLogData(self) -> None:
         '''
         Clears all currently loaded data
         '''
-        self.log = self.log[0:0]
+        self.buffer.clear()
         
     def isConnected(self) -> bool:
         '''
@@ -87,8 +152,21 @@ class ModbusLogger:
     def setTagMap(self, tag_map: list[dict]) -> None:
         '''
         Set the tag map for the registers
+        The loaded data is cleared and a running writer is restarted
         '''
-        self.tag_map = tag_map
+        # Map of tag locations, types and scaling
+        self.tag_map = tag_map if isinstance(tag_map, TagMap) else TagMap(tag_map)
+
+        # Rows of the previous map do not belong under the new tag names
+        columns = len(self.tag_map)
+        if getattr(self, 'buffer', None) is None or self.buffer.columns != columns:
+            self.buffer = RingBuffer(columns, retention=self.retention)
+        else:
+            self.buffer.clear()
+
+        # Start a file with the new columns, rows of the new map can not go under the old header
+        if self.writer is not None:
+            self.startWriter(self.writer.path, **self.writer_kwargs)
 
 
 
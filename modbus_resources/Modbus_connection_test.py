@@ -1,6 +1,7 @@
 from pyModbusTCP.client import ModbusClient
 from pyModbusTCP import utils
-import struct
+
+from modbus_resources.tag_map import TagMap
 
 
 if __name__ == '__main__':
@@ -22,12 +23,9 @@ if __name__ == '__main__':
     Used for float values
     '''
     client = ModbusClient(host=plc_ip, port=float_port, unit_id=unit_id, auto_open=True, auto_close=False) 
-    regs = client.read_holding_registers(0, num_reg_to_read)
-    # Convert registers to float values
-    float_values = []
-    for i in range(0, num_reg_to_read-1, 2):
-        raw = struct.pack(">HH", regs[i], regs[i + 1])  # Big Endian format
-        float_values.append(struct.unpack(">f", raw)[0])  # Convert to float
-    print("Float values:", float_values)
+    # Big endian float32 in register pairs
+    float_map = TagMap([{'tag': str(i), 'address': 2*i, 'type': 'float32'} for i in range(num_reg_to_read // 2)])
+    float_values = float_map.readWith(client.read_holding_registers)
+    print("Float values:", float_values.tolist())
 
 
@@ -0,0 +1,207 @@
+import io
+import os
+import csv
+import time
+import queue
+import threading
+from datetime import datetime
+
+import numpy as np
+
+
+
+class LogWriter(threading.Thread):
+    '''
+    Background thread appending logged rows to CSV files on disk
+    Rows are queued by put() and written in batches every flush_interval seconds or flush_rows rows,
+    so a crash loses at most one batch. Files are named <log name>_<date>.csv, a new file is started
+    every day and, if max_bytes is set, when a file grows past max_bytes (<log name>_<date>_<n>.csv)
+    path: str = Path of the log, i.e. Logs/ModbusLog.csv
+    columns: list = Names of the values in a row
+    flush_interval: float = Seconds between writes
+    flush_rows: int = Number of queued rows that triggers a write before the interval is up
+    max_bytes: int = Size a file is rotated at, None only rotates daily
+    fsync: str = When written data is forced to disk, 'never', 'flush' (every batch) or 'rotate' (when a file is closed)
+    '''
+    fsync_policies = ('never', 'flush', 'rotate')
+
+    def __init__(self, path: str, columns: list, flush_interval: float=5.0, flush_rows: int=1000,
+                 max_bytes: int=None, fsync: str='flush') -> None:
+        super().__init__(daemon=True)
+        if fsync not in self.fsync_policies:
+            raise ValueError(f'fsync must be one of {self.fsync_policies}')
+        self.path = path
+        self.header = self.formatRows([['time'] + [str(column) for column in columns]])
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+
+        # Rows waiting to be written, None stops the thread
+        self.queue = queue.Queue()
+        self.batch = []
+        self.file = None
+        self.day = None
+        self.index = 0
+        self.rows_written = 0
+
+    def put(self, t: float, row) -> None:
+        '''
+        Queues a row of values read at UNIX time t, safe to call from any thread
+        '''
+        self.queue.put((t, np.array(row, copy=True)))
+
+    def stop(self, timeout: float=None) -> None:
+        '''
+        Writes the queued rows, closes the file and ends the thread
+        '''
+        self.queue.put(None)
+        self.join(timeout)
+
+    def run(self) -> None:
+        deadline = time.monotonic() + self.flush_interval
+        running = True
+        while running:
+            # Collect rows until the batch is full, the interval is up or the writer is stopped
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                if item is None:
+                    running = False
+                else:
+                    self.batch.append(item)
+            except queue.Empty:
+                pass
+
+            if not running or len(self.batch) >= self.flush_rows or time.monotonic() >= deadline:
+                self.flush()
+                deadline = time.monotonic() + self.flush_interval
+        self.close()
+
+    def flush(self) -> None:
+        '''
+        Appends the batch to the log, rows are removed from the batch once written
+        and the rest are kept for the next flush if writing fails
+        '''
+        try:
+            while self.batch:
+                # Write the rows of one day at a time, a file that failed to open is opened again here
+                day = datetime.fromtimestamp(self.batch[0][0]).date()
+                count = 1
+                while count < len(self.batch) and datetime.fromtimestamp(self.batch[count][0]).date() == day:
+                    count += 1
+                if self.file is None or day != self.day:
+                    self.openFile(day)
+                self.writeRows(self.batch[:count])
+                del self.batch[:count]
+            if self.fsync == 'flush' and self.file is not None:
+                os.fsync(self.file.fileno())
+        except Exception as ex:
+            print("Error writing log, retrying with the next batch: ", ex)
+
+    def writeRows(self, rows: list) -> None:
+        '''
+        Writes (time, values) rows to the open file, starting the next file first if it is over max_bytes
+        '''
+        if self.max_bytes is not None and self.file.tell() >= self.max_bytes:
+            self.openFile(self.day)
+        self.file.write(self.formatRows(
+            [datetime.fromtimestamp(t).isoformat(sep=' ')] + row.tolist() for t, row in rows
+            ))
+        self.file.flush()
+        self.rows_written += len(rows)
+
+    @staticmethod
+    def formatRows(rows) -> str:
+        '''
+        Returns rows as CSV lines, fields such as tag names with quotes or commas are quoted
+        '''
+        text = io.StringIO()
+        csv.writer(text, lineterminator='\n').writerows(rows)
+        return text.getvalue()
+
+    def filePath(self, day, index: int) -> str:
+        '''
+        Returns the path of a file of the log
+        '''
+        root, ext = os.path.splitext(self.path)
+        suffix = f'_{index}' if index else ''
+        return f'{root}_{day:%Y-%m-%d}{suffix}{ext or ".csv"}'
+
+    def openFile(self, day) -> None:
+        '''
+        Opens the file to append to for a day
+        An existing file is continued if it has the same columns and room left, after removing
+        a line left half written by a crash
+        '''
+        self.close()
+        index = 0
+        if self.day == day:
+            index = self.index + 1
+        while True:
+            path = self.filePath(day, index)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                break
+            if self.max_bytes is None or os.path.getsize(path) < self.max_bytes:
+                with open(path, 'r', newline='') as f:
+                    if f.readline() == self.header:
+                        break
+            index += 1
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            self.recoverLastLine(path)
+        self.file = open(path, 'a', newline='')
+        if self.file.tell() == 0:
+            self.file.write(self.header)
+        self.day = day
+        self.index = index
+
+    def close(self) -> None:
+        '''
+        Closes the open file
+        '''
+        if self.file is None:
+            return
+        self.file.flush()
+        if self.fsync != 'never':
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+    @staticmethod
+    def recoverLastLine(path: str) -> None:
+        '''
+        Truncates a file after its last complete line, removing a line left half written by a crash
+        '''
+        with open(path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+
+            # Search backwards for the end of the last complete line
+            position = size
+            while position > 0:
+                step = min(64*1024, position)
+                position -= step
+                f.seek(position)
+                end = f.read(step).rfind(b'\n')
+                if end != -1:
+                    f.truncate(position + end + 1)
+                    return
+            f.truncate(0)
+
+
+
+if __name__ == '__main__':
+    # Write a minute of 1 Hz rows of 60 registers, rotating every 2 kB
+    writer = LogWriter('Logs/ModbusTestLog.csv', list(range(60)), flush_interval=1, max_bytes=2048)
+    writer.start()
+    start = time.time()
+    for i in range(60):
+        writer.put(start + i, np.arange(60))
+    writer.stop()
+    print(f'{writer.rows_written} rows written to {writer.filePath(writer.day, writer.index)}')
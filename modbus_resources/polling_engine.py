@@ -0,0 +1,290 @@
+import asyncio
+import argparse
+import random
+import struct
+import threading
+import time
+
+from modbus_resources.tag_map import TagMap
+
+
+class ModbusDevice:
+    '''
+    A Modbus TCP server polled by the PollingEngine
+    name: str = Name the device's polls are reported under
+    ip: str = Server address
+    port: int = Server port
+    unit_id: int = Modbus unit id
+    start: int = First holding register read
+    count: int = Number of holding registers read (at most 125)
+    interval: float = Seconds between polls
+    timeout: float = Seconds to wait for the connection or a response
+    tag_map: TagMap = Tags to read and decode, replaces start and count if given
+    '''
+    def __init__(self, name: str, ip: str, port: int=502, unit_id: int=1, start: int=0, count: int=1,
+                 interval: float=1.0, timeout: float=2.0, tag_map: TagMap=None) -> None:
+        self.name = name
+        self.ip = ip
+        self.port = port
+        self.unit_id = unit_id
+        self.start = start
+        self.count = count
+        self.interval = interval
+        self.timeout = timeout
+        self.tag_map = tag_map
+
+        # Poll statistics
+        self.polls = 0
+        self.errors = 0
+        self.missed = 0
+        self.latency = None
+        self.connected = False
+
+    def stats(self) -> dict:
+        '''
+        Returns the poll statistics of the device
+        '''
+        return {'polls': self.polls, 'errors': self.errors, 'missed': self.missed,
+                'latency': self.latency, 'connected': self.connected}
+
+
+class ModbusError(Exception):
+    '''
+    Exception response from a Modbus server
+    '''
+
+
+class AsyncModbusClient:
+    '''
+    Minimal asyncio Modbus TCP client for reading holding registers (function 3)
+    '''
+    def __init__(self, ip: str, port: int, unit_id: int) -> None:
+        self.ip = ip
+        self.port = port
+        self.unit_id = unit_id
+        self.reader = None
+        self.writer = None
+        self.transaction = 0
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.ip, self.port)
+
+    def isOpen(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def readHoldingRegisters(self, start: int, count: int) -> list:
+        '''
+        Reads count holding registers starting at start
+        '''
+        self.transaction = (self.transaction + 1) % 0x10000
+        request = struct.pack('>HHHBBHH', self.transaction, 0, 6, self.unit_id, 3, start, count)
+        self.writer.write(request)
+        await self.writer.drain()
+
+        # MBAP header, then the rest of the response
+        transaction, _, length, _ = struct.unpack('>HHHB', await self.reader.readexactly(7))
+        if length < 3:
+            raise ModbusError(f'Response length {length} is too short')
+        pdu = await self.reader.readexactly(length - 1)
+        if transaction != self.transaction:
+            raise ModbusError(f'Response to transaction {transaction}, expected {self.transaction}')
+        if pdu[0] & 0x80:
+            raise ModbusError(f'Exception code {pdu[1]}')
+        if pdu[0] != 3 or pdu[1] != 2*count or len(pdu) != 2 + pdu[1]:
+            raise ModbusError(f'Response of function {pdu[0]} with {pdu[1]} bytes, expected {2*count} bytes of registers')
+        return list(struct.unpack(f'>{count}H', pdu[2:]))
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+
+
+class PollingEngine:
+    '''
+    Polls many Modbus TCP servers concurrently on an asyncio loop in a background thread
+    Every device is polled on its own schedule, polls are due at start + k*interval on the monotonic
+    clock so they do not drift, and polls that could not be made in time are skipped and counted
+    A device that fails is reconnected with exponential backoff without holding up the others
+    Results are passed to callback(device, time, values) and failures to
+    error_callback(device, exception), both are called from the engine thread
+    backoff: float = Seconds before the first reconnect attempt
+    max_backoff: float = Longest wait between reconnect attempts
+    '''
+    def __init__(self, callback=None, error_callback=None, backoff: float=1.0, max_backoff: float=30.0) -> None:
+        self.callback = callback
+        self.error_callback = error_callback
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.devices = {}
+        self.tasks = {}
+        self.loop = None
+        self.thread = None
+
+    def start(self) -> None:
+        '''
+        Starts the engine thread and polling of the devices already added
+        '''
+        if self.thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(ready,), daemon=True)
+        self.thread.start()
+        ready.wait()
+        for device in self.devices.values():
+            self.startDevice(device)
+
+    def run(self, ready: threading.Event) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    def stop(self) -> None:
+        '''
+        Stops polling, closes the connections and ends the engine thread
+        '''
+        if self.thread is None:
+            return
+        for name in list(self.tasks):
+            self.stopDevice(name)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self.thread = None
+
+    def addDevice(self, device: ModbusDevice) -> None:
+        '''
+        Adds a device, replacing a device of the same name, polling starts right away if the engine runs
+        '''
+        self.removeDevice(device.name)
+        self.devices[device.name] = device
+        if self.thread is not None:
+            self.startDevice(device)
+
+    def removeDevice(self, name: str) -> None:
+        '''
+        Stops polling a device and removes it
+        '''
+        self.stopDevice(name)
+        self.devices.pop(name, None)
+
+    def startDevice(self, device: ModbusDevice) -> None:
+        self.tasks[device.name] = asyncio.run_coroutine_threadsafe(self.createTask(device), self.loop).result()
+
+    def stopDevice(self, name: str) -> None:
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            asyncio.run_coroutine_threadsafe(self.cancelTask(task), self.loop).result()
+
+    async def createTask(self, device: ModbusDevice) -> asyncio.Task:
+        return asyncio.get_running_loop().create_task(self.poll(device))
+
+    async def cancelTask(self, task: asyncio.Task) -> None:
+        # Wait for the task so its connection is closed before the loop stops
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def poll(self, device: ModbusDevice) -> None:
+        '''
+        Polls a device until cancelled
+        '''
+        client = AsyncModbusClient(device.ip, device.port, device.unit_id)
+        backoff = self.backoff
+        due = time.monotonic()
+        try:
+            while True:
+                try:
+                    if not client.isOpen():
+                        await asyncio.wait_for(client.connect(), device.timeout)
+                        device.connected = True
+
+                    sent = time.monotonic()
+                    values = await asyncio.wait_for(self.read(client, device), device.timeout)
+                    device.latency = time.monotonic() - sent
+                    device.polls += 1
+                    backoff = self.backoff
+                    if self.callback is not None:
+                        self.callback(device, time.time(), values)
+
+                except Exception as ex:
+                    # Any error, including a failed decode or callback, drops the connection and waits
+                    # before reconnecting instead of ending the task, cancellation is not an Exception
+                    # and still stops it. A little randomness keeps devices behind the same gateway
+                    # from reconnecting in step
+                    device.errors += 1
+                    device.connected = False
+                    await client.close()
+                    if self.error_callback is not None:
+                        self.error_callback(device, ex)
+                    await asyncio.sleep(backoff*random.uniform(0.8, 1.2))
+                    backoff = min(backoff*2, self.max_backoff)
+
+                # Wait for the next poll on the fixed schedule, skipping polls that are already late
+                due += device.interval
+                now = time.monotonic()
+                if now > due:
+                    late = int((now - due) // device.interval) + 1
+                    device.missed += late
+                    due += late*device.interval
+                await asyncio.sleep(due - time.monotonic())
+        finally:
+            device.connected = False
+            await client.close()
+
+    async def read(self, client: AsyncModbusClient, device: ModbusDevice):
+        '''
+        Reads a device's registers, decoded to tag values if the device has a tag map
+        '''
+        if device.tag_map is None:
+            return await client.readHoldingRegisters(device.start, device.count)
+        registers = []
+        for start, count in device.tag_map.blocks:
+            registers.extend(await client.readHoldingRegisters(start, count))
+        return device.tag_map.decode(registers)
+
+    def stats(self) -> dict:
+        '''
+        Returns the poll statistics of every device
+        '''
+        return {name: device.stats() for name, device in self.devices.items()}
+
+
+
+if __name__ == '__main__':
+    # Poll local stand-in servers, started with pyModbusTCP, and print the statistics
+    parser = argparse.ArgumentParser(description='Poll Modbus TCP servers with the polling engine')
+    parser.add_argument('--devices', type=int, default=3, help='Number of local stand-in servers')
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    from pyModbusTCP.server import ModbusServer
+
+    servers = []
+    engine = PollingEngine(error_callback=lambda device, ex: print(f'{device.name}: {ex!r}'))
+    for i in range(args.devices):
+        server = ModbusServer('localhost', 5020 + i, no_block=True)
+        server.start()
+        server.data_bank.set_holding_registers(0, list(range(i, i + 60)))
+        servers.append(server)
+        engine.addDevice(ModbusDevice(f'PLC {i}', 'localhost', 5020 + i, start=0, count=60,
+                                      interval=args.interval, timeout=0.5))
+
+    # A device with no server behind it, backs off without delaying the others
+    engine.addDevice(ModbusDevice('Offline', 'localhost', 5019, interval=args.interval, timeout=0.5))
+
+    engine.start()
+    time.sleep(args.seconds)
+    engine.stop()
+    for server in servers:
+        server.stop()
+    for name, stats in engine.stats().items():
+        print(name, stats)
@@ -0,0 +1,117 @@
+import time
+
+import numpy as np
+
+
+
+class RingBuffer:
+    '''
+    Growable ring buffer of timestamped rows for live logging, appending a row is O(1)
+    Every row is written twice, at i and i + capacity, so the stored rows are always one
+    contiguous slice of the arrays and can be handed to plots without copying
+    Rows older than the retention window are dropped, the buffer grows instead while all
+    of its rows are still inside the window
+    columns: int = Number of values in a row
+    capacity: int = Number of rows allocated up front
+    retention: float = Seconds of data to keep, None keeps everything
+    dtype: type = Type of the stored values
+    '''
+    def __init__(self, columns: int, capacity: int=3600, retention: float=None, dtype: type=np.float64) -> None:
+        self.columns = columns
+        self.retention = retention
+        self.dtype = dtype
+
+        # First row and number of rows in the buffer
+        self.start = 0
+        self.count = 0
+        self.allocate(max(capacity, 1))
+
+    def allocate(self, capacity: int) -> None:
+        '''
+        Allocates arrays for a capacity, keeping the stored rows
+        '''
+        times = np.empty(2*capacity, dtype=np.float64)
+        values = np.empty((2*capacity, self.columns), dtype=self.dtype)
+        if self.count:
+            times[:self.count] = times[capacity:capacity + self.count] = self.times()
+            values[:self.count] = values[capacity:capacity + self.count] = self.values()
+        self.capacity = capacity
+        self._times = times
+        self._values = values
+        self.start = 0
+
+    def append(self, t: float, row) -> None:
+        '''
+        Appends a row of values read at UNIX time t
+        '''
+        # Drop rows that left the retention window
+        if self.retention is not None and self.count:
+            expired = int(np.searchsorted(self.times(), t - self.retention, side='left'))
+            self.start = (self.start + expired) % self.capacity
+            self.count -= expired
+
+        # Grow when full, doubling keeps appends O(1) on average
+        if self.count == self.capacity:
+            self.allocate(2*self.capacity)
+
+        i = (self.start + self.count) % self.capacity
+        self._times[i] = self._times[i + self.capacity] = t
+        self._values[i] = self._values[i + self.capacity] = row
+        self.count += 1
+
+    def times(self) -> np.ndarray:
+        '''
+        Returns a view of the UNIX times of the stored rows, oldest first
+        The view is only valid until the next append or clear
+        '''
+        return self._times[self.start:self.start + self.count]
+
+    def values(self) -> np.ndarray:
+        '''
+        Returns a view of the stored rows, oldest first
+        The view is only valid until the next append or clear
+        '''
+        return self._values[self.start:self.start + self.count]
+
+    def column(self, index: int) -> np.ndarray:
+        '''
+        Returns a view of one value of the stored rows, oldest first
+        '''
+        return self.values()[:, index]
+
+    def last(self) -> tuple:
+        '''
+        Returns the (time, row) of the newest row
+        '''
+        i = self.start + self.count - 1
+        return self._times[i], self._values[i]
+
+    def clear(self) -> None:
+        '''
+        Removes all rows, the allocated arrays are kept
+        '''
+        self.start = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def nbytes(self) -> int:
+        '''
+        Returns the memory allocated for the buffer
+        '''
+        return self._times.nbytes + self._values.nbytes
+
+
+
+if __name__ == '__main__':
+    # Benchmark a day of 1 Hz polls of 60 registers
+    n = 86400
+    buffer = RingBuffer(60, retention=3600)
+    row = np.arange(60)
+    start = time.perf_counter()
+    for i in range(n):
+        buffer.append(1.67e9 + i, row)
+    elapsed = time.perf_counter() - start
+    print(f'{n} appends in {elapsed:.3f} s ({elapsed/n*1e6:.1f} us each), {len(buffer)} rows kept, '
+          f'{buffer.nbytes()/1e6:.1f} MB allocated')